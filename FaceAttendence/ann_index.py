@@ -0,0 +1,178 @@
+import hashlib
+import os
+
+import numpy as np
+
+MIN_TRAIN_SIZE = 256
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50000
+DEFAULT_NPROBE = 8
+RETRAIN_GROWTH = 4
+
+
+def _sq_distances(queries, points, point_sq_norms):
+    sq = np.einsum('ij,ij->i', queries, queries)[:, None] + point_sq_norms[None, :]
+    sq -= 2.0 * (queries @ points.T)
+    np.maximum(sq, 0.0, out=sq)
+    return sq
+
+
+def gallery_fingerprint(encodings, ids):
+    """Hash of a gallery's rows, so a saved index is only reused for the rows it was built on."""
+    digest = hashlib.sha1()
+    digest.update('\n'.join(str(face_id) for face_id in ids).encode('utf-8'))
+    digest.update(np.ascontiguousarray(encodings, dtype=np.float32))
+    return digest.hexdigest()
+
+
+class IVFFlatIndex:
+    """Inverted-file index over a FaceGallery matrix.
+
+    Rows are bucketed by their nearest k-means centroid. A search only scans
+    the rows of the nprobe buckets closest to the query, so cost grows with
+    N / n_lists * nprobe instead of N.
+
+    search() may run while add() or train() does, without a lock: centroids
+    and lists are replaced together as one _state tuple, lists only ever
+    grow, and search() ignores rows past the matrix it was given.
+    """
+
+    def __init__(self, n_lists=None, nprobe=DEFAULT_NPROBE, seed=0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.seed = seed
+        # (centroids, centroid squared norms, row lists, cached row arrays), or None untrained
+        self._state = None
+        self.size = 0
+        self.trained_size = 0
+
+    @property
+    def centroids(self):
+        return None if self._state is None else self._state[0]
+
+    @property
+    def trained(self):
+        return self._state is not None
+
+    def train(self, matrix):
+        count = matrix.shape[0]
+        if count < MIN_TRAIN_SIZE:
+            self._state = None
+            self.size = 0
+            return False
+        n_lists = self.n_lists or int(np.clip(np.sqrt(count), 8, 4096))
+        rng = np.random.default_rng(self.seed)
+        sample = matrix
+        if count > KMEANS_SAMPLE:
+            sample = matrix[rng.choice(count, KMEANS_SAMPLE, replace=False)]
+        sample = np.ascontiguousarray(sample, dtype=np.float32)
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+            labels = np.argmin(_sq_distances(sample, centroids, centroid_sq), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Reseed empty lists from random points so no bucket stays dead
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample.shape[0], len(empty), replace=False)]
+        centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+        labels = np.argmin(_sq_distances(np.asarray(matrix, dtype=np.float32), centroids, centroid_sq), axis=1)
+        self._set_state(centroids, labels.tolist())
+        self.size = count
+        self.trained_size = count
+        return True
+
+    def _set_state(self, centroids, labels):
+        # Lists are filled before the swap, so a search sees either the old index or the whole new one
+        centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        lists = [[] for _ in range(centroids.shape[0])]
+        for row, label in enumerate(labels):
+            lists[label].append(row)
+        self._state = (centroids, np.einsum('ij,ij->i', centroids, centroids), lists, [None] * len(lists))
+
+    def assign(self, encodings):
+        centroids, centroid_sq = self._state[:2]
+        encodings = np.asarray(encodings, dtype=np.float32)
+        return np.argmin(_sq_distances(encodings, centroids, centroid_sq), axis=1)
+
+    def needs_retrain(self, size):
+        # Centroids learnt on a much smaller gallery leave the lists unbalanced
+        return not self.trained or size > RETRAIN_GROWTH * self.trained_size
+
+    def add(self, encodings):
+        """Append rows; they get row numbers following the ones already indexed."""
+        if not self.trained:
+            return
+        lists = self._state[2]
+        labels = self.assign(encodings)
+        for offset, label in enumerate(labels.tolist()):
+            lists[label].append(self.size + offset)
+        self.size += len(labels)
+
+    @staticmethod
+    def _rows(state, label):
+        # The cached array is stale once its list has grown; checking the length instead of
+        # clearing the cache in add() means a search cannot put back an array add() just dropped
+        members, arrays = state[2][label], state[3]
+        rows = arrays[label]
+        if rows is None or len(rows) != len(members):
+            rows = np.asarray(members[:len(members)], dtype=np.int64)
+            arrays[label] = rows
+        return rows
+
+    def search(self, queries, matrix, sq_norms, nprobe=None):
+        """Return (rows, distances) of the nearest indexed row for each query.
+
+        A row of -1 means none of the probed lists held any rows.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        best_rows = np.full(queries.shape[0], -1, dtype=np.int64)
+        best_dist = np.full(queries.shape[0], np.inf, dtype=np.float32)
+        state = self._state
+        if state is None:
+            return best_rows, best_dist
+        centroids, centroid_sq = state[:2]
+        nprobe = min(nprobe or self.nprobe, centroids.shape[0])
+        probe_sq = _sq_distances(queries, centroids, centroid_sq)
+        probes = np.argpartition(probe_sq, nprobe - 1, axis=1)[:, :nprobe]
+        count = matrix.shape[0]
+        for q, labels in enumerate(probes):
+            rows = np.concatenate([self._rows(state, label) for label in labels])
+            # Rows added after the caller sliced the matrix
+            rows = rows[rows < count]
+            if len(rows) == 0:
+                continue
+            sq = _sq_distances(queries[q:q + 1], matrix[rows], sq_norms[rows])[0]
+            best = int(np.argmin(sq))
+            best_rows[q] = rows[best]
+            best_dist[q] = np.sqrt(sq[best])
+        return best_rows, best_dist
+
+    def save(self, path, fingerprint):
+        """Save the index; fingerprint is gallery_fingerprint() of the rows it covers."""
+        labels = np.empty(self.size, dtype=np.int32)
+        for label, rows in enumerate(self._state[2]):
+            labels[rows] = label
+        np.savez(path, centroids=self.centroids, labels=labels, nprobe=self.nprobe, fingerprint=fingerprint)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Load an index saved with save(), or return None if it was saved for other rows."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            # Same row count is not enough: a removed and an added student shift every row after them
+            if 'fingerprint' not in data.files or str(data['fingerprint']) != fingerprint:
+                return None
+            labels = data['labels']
+            index = cls(nprobe=int(data['nprobe']))
+            index._set_state(data['centroids'], labels.tolist())
+        index.n_lists = index.centroids.shape[0]
+        index.size = len(labels)
+        index.trained_size = len(labels)
+        return index
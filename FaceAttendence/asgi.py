@@ -0,0 +1,209 @@
+"""ASGI entry point, run with: uvicorn asgi:app --port 8000
+
+Frame and registration uploads are read asynchronously, so slow clients
+do not hold a thread, and recognition runs on a bounded thread pool that
+answers 429/503 when it is saturated. Every other route is served by the
+Flask app in demo.py.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import demo
+from events import format_events
+
+ASGI_WORKERS = int(os.environ.get("ASGI_WORKERS", "0")) or os.cpu_count() or 1
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", "0")) or 2 * ASGI_WORKERS
+ASGI_QUEUE_TIMEOUT_MS = float(os.environ.get("ASGI_QUEUE_TIMEOUT_MS", "2000"))
+MAX_FRAME_BYTES = int(os.environ.get("MAX_FRAME_BYTES", str(8 * 1024 * 1024)))
+EVENT_KEEPALIVE_SECONDS = 15.0
+
+
+class Overloaded(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class BoundedExecutor:
+    """Thread pool that turns work away instead of queueing it without limit.
+
+    At most max_pending calls may be running or waiting. Beyond that, run()
+    raises Overloaded(429). A call that waited longer than queue_timeout for
+    a thread is dropped with Overloaded(503), since its frame is stale by
+    the time it would run.
+    """
+
+    def __init__(self, workers, max_pending, queue_timeout):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asgi-inference")
+        self._lock = threading.Lock()
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.pending = 0
+        self.rejected = 0
+        self.expired = 0
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(429, "Server busy, retry later")
+            self.pending += 1
+        queued_at = time.monotonic()
+
+        def call():
+            try:
+                if time.monotonic() - queued_at > self.queue_timeout:
+                    with self._lock:
+                        self.expired += 1
+                    raise Overloaded(503, "Frame waited too long for a worker")
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.pending -= 1
+
+        return await asyncio.wrap_future(self._executor.submit(call))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+executor = BoundedExecutor(ASGI_WORKERS, ASGI_MAX_PENDING, ASGI_QUEUE_TIMEOUT_MS / 1000.0)
+
+
+async def read_body(request):
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_FRAME_BYTES:
+            raise Overloaded(413, "Image too large")
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def read_json(request):
+    try:
+        return json.loads(await read_body(request) or b'null')
+    except ValueError:
+        return None
+
+
+async def process_frame_raw(request):
+    # Same contract as the Flask route: raw JPEG body or an "image" multipart file
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form(max_part_size=MAX_FRAME_BYTES)
+        upload = form.get('image')
+        image_bytes = await upload.read() if upload is not None else b''
+    else:
+        image_bytes = await read_body(request)
+    if not image_bytes:
+        return JSONResponse({"error": "No image data received"}, status_code=400)
+    demo.frame_gate.count_client_skips(request.headers.get('x-frames-skipped'))
+    result = await executor.run(demo.process_frame_bytes, image_bytes, request.headers.get('x-session-id'))
+    return JSONResponse(result)
+
+
+async def process_frame(request):
+    data = await read_json(request)
+    if not data or 'image' not in data:
+        return JSONResponse({"error": "No image data received"}, status_code=400)
+    demo.frame_gate.count_client_skips(request.headers.get('x-frames-skipped'))
+    result = await executor.run(demo.process_frame, data['image'],
+                                data.get('session') or request.headers.get('x-session-id'))
+    return JSONResponse(result)
+
+
+async def register_student(request):
+    data = await read_json(request)
+    if not data or 'roll' not in data or 'name' not in data:
+        return JSONResponse({"status": "error", "message": "Missing required data"})
+    success, message = await executor.run(demo.register_unknown_face,
+                                          data.get('session') or request.headers.get('x-session-id'),
+                                          data['roll'], data['name'])
+    return JSONResponse({"status": "success" if success else "error", "message": message})
+
+
+async def session_events(request):
+    # Same events as the Flask route, but a waiting client holds no thread
+    key = request.path_params['key']
+    topic = demo.session_topic(key)
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    def notify():
+        # Called on the publishing thread
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # the event loop has already shut down
+
+    subscriber = demo.broadcaster.subscribe(topic, notify)
+
+    async def body():
+        try:
+            yield ": connected\n\n"
+            yield format_events([demo.attendance_snapshot(key)])
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                wake.clear()
+                events, dropped = subscriber.drain()
+                if events or dropped:
+                    yield format_events(events, dropped, lambda: demo.attendance_snapshot(key))
+        finally:
+            demo.broadcaster.unsubscribe(topic, subscriber)
+
+    return StreamingResponse(body(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def overloaded(request, exc):
+    headers = {'Retry-After': '1'} if exc.status in (429, 503) else None
+    return JSONResponse({"error": str(exc)}, status_code=exc.status, headers=headers)
+
+
+demo.metrics.gauges['face_asgi_pending'] = lambda: executor.pending
+demo.metrics.gauges['face_asgi_rejected'] = lambda: executor.rejected
+demo.metrics.gauges['face_asgi_expired'] = lambda: executor.expired
+
+
+@asynccontextmanager
+async def lifespan(app):
+    demo.create_app()
+    yield
+    executor.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route('/process_frame_raw', process_frame_raw, methods=['POST']),
+        Route('/process_frame', process_frame, methods=['POST']),
+        Route('/register_student', register_student, methods=['POST']),
+        Route('/sessions/{key:path}/events', session_events),
+        Mount('/', app=WSGIMiddleware(demo.app)),
+    ],
+    exception_handlers={Overloaded: overloaded},
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", "8000")))
@@ -0,0 +1,190 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def new_session_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class AttendanceJournal:
+    """Append-only JSON-lines log of attendance events with a write-behind flusher.
+
+    record() only appends to an in-memory buffer; a background thread writes
+    and fsyncs the buffer every flush_interval seconds, or sooner once
+    flush_count events are waiting, so the frame path never touches the disk.
+
+    Once the log grows past rotate_bytes, it is renamed to
+    <name>-<timestamp>.jsonl and a new log is started with only the events
+    of sessions still open, so recovery reads live sessions rather than the
+    whole history. A batch a sink fails to apply (e.g. a locked database)
+    is kept and handed to it again, ahead of new events, on the next flush;
+    rotation waits until nothing is pending, so archived events are always
+    already in the database.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_count=100, rotate_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_count = flush_count
+        self.rotate_bytes = rotate_bytes
+        self._rotate_at = rotate_bytes
+        # Events a sink failed to apply, per sink, retried before its next batch
+        self._pending = {}
+        # start and present events of sessions not cleared yet, as written to the log
+        self._open = {}
+        self._loaded = False
+        self._buffer = []
+        # Called with each flushed batch after it is on disk, e.g. to update the database
+        self.sinks = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if not self._loaded:
+            # Rotation carries open sessions over, so they must be known before the first flush
+            self.open_sessions()
+        # Terminate a torn last line so the next batch starts on a fresh line
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb+') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    file.write(b'\n')
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="attendance-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._running:
+            self._running = False
+            self._wake.set()
+            self._thread.join()
+        self.flush()
+
+    def _append(self, event):
+        with self._lock:
+            self._buffer.append(event)
+            pending = len(self._buffer)
+        if pending >= self.flush_count:
+            self._wake.set()
+
+    def record_start(self, session, class_name, timestamp, camera=None):
+        self._append({'event': 'start', 'session': session, 'class': class_name, 'camera': camera, 'ts': timestamp})
+
+    def record_present(self, roll, session, timestamp):
+        self._append({'event': 'present', 'roll': roll, 'session': session, 'ts': timestamp})
+
+    def record_clear(self, session, timestamp):
+        self._append({'event': 'clear', 'session': session, 'ts': timestamp})
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing attendance log: {str(e)}")
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if not events and not self._pending:
+                return 0
+            if events:
+                lines = ''.join(json.dumps(event) + '\n' for event in events)
+                with open(self.path, 'a') as file:
+                    file.write(lines)
+                    file.flush()
+                    os.fsync(file.fileno())
+            for sink in self.sinks:
+                self._apply(sink, events)
+            for event in events:
+                self._track(event)
+            if self.rotate_bytes and not self._pending and os.path.getsize(self.path) > self._rotate_at:
+                self._rotate()
+            return len(events)
+
+    def _apply(self, sink, events):
+        # Events a sink missed go first, so it sees every event in order
+        batch = self._pending.get(sink, []) + events
+        if not batch:
+            return
+        try:
+            sink(batch)
+        except Exception as e:
+            self._pending[sink] = batch
+            print(f"Error applying attendance events ({len(batch)} will be retried): {str(e)}")
+        else:
+            self._pending.pop(sink, None)
+
+    def _track(self, event):
+        kind = event.get('event')
+        if kind == 'clear':
+            self._open.pop(event['session'], None)
+        elif kind in ('start', 'present'):
+            self._open.setdefault(event['session'], []).append(event)
+
+    def _rotate(self):
+        root, extension = os.path.splitext(self.path)
+        archive = f"{root}-{new_session_id()}{extension}"
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            file.write(''.join(json.dumps(event) + '\n' for events in self._open.values() for event in events))
+            file.flush()
+            os.fsync(file.fileno())
+        # A crash between the two renames leaves only the .tmp log, which open_sessions() picks up
+        os.replace(self.path, archive)
+        os.replace(tmp_path, self.path)
+        size = os.path.getsize(self.path)
+        # Open sessions alone may be large; wait for the log to grow again before the next rotation
+        self._rotate_at = max(self.rotate_bytes, 2 * size)
+        print(f"Rotated attendance log to {archive}, kept {len(self._open)} open sessions.")
+
+    def archives(self):
+        """Rotated logs, oldest first."""
+        root, extension = os.path.splitext(self.path)
+        directory = os.path.dirname(self.path) or '.'
+        prefix = os.path.basename(root) + '-'
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.startswith(prefix) and name.endswith(extension))
+
+    def open_sessions(self):
+        """Rebuild every session that was started but not cleared.
+
+        Returns a list of {'session', 'class', 'camera', 'present'} dicts in
+        the order the sessions were started, where present maps roll to the
+        first-seen timestamp. Logs written before cameras were recorded give
+        camera None.
+        """
+        self._open = {}
+        self._loaded = True
+        if not os.path.exists(self.path) and os.path.exists(self.path + ".tmp"):
+            os.replace(self.path + ".tmp", self.path)
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    self._track(json.loads(line))
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+        sessions = []
+        for session_id, events in self._open.items():
+            session = {'session': session_id, 'class': None, 'camera': None, 'present': {}}
+            for event in events:
+                if event['event'] == 'start':
+                    session.update({'class': event.get('class'), 'camera': event.get('camera'), 'present': {}})
+                else:
+                    session['present'].setdefault(event['roll'], event['ts'])
+            sessions.append(session)
+        return sessions
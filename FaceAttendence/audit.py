@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from gallery import DEFAULT_TOLERANCE
+from embedding_store import EmbeddingStore
+from enrol import DUPLICATE_DISTANCE
+
+BLOCK_SIZE = 1024
+MAX_DUPLICATE_PAIRS = 1000
+# Share of students allowed to have another student's template within the suggested tolerance
+IMPOSTOR_QUANTILE = 1.0
+# Share of a student's own templates that should stay within it
+GENUINE_QUANTILE = 99.0
+
+
+def _summary(values):
+    if len(values) == 0:
+        return None
+    return {
+        'count': int(len(values)),
+        'min': float(values.min()),
+        'p1': float(np.percentile(values, 1)),
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+def nearest_neighbours(encodings, labels, duplicate_distance, block_size=BLOCK_SIZE,
+                       max_pairs=MAX_DUPLICATE_PAIRS):
+    """Nearest other-identity and same-identity row for every row, in blocks.
+
+    Only a block_size x block_size distance tile exists at a time, and each
+    tile is used for both of its row ranges, so the whole pass is N^2 / 2
+    distances in O(N + block_size^2) memory. Returns (impostor_sq,
+    impostor_row, genuine_sq, pairs): squared distances, the row of the
+    nearest impostor, and {(label_a, label_b): squared distance} for
+    identity pairs closer than duplicate_distance (at most max_pairs, the
+    closest kept).
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    count = encodings.shape[0]
+    sq_norms = np.einsum('ij,ij->i', encodings, encodings)
+    impostor_sq = np.full(count, np.inf, dtype=np.float32)
+    impostor_row = np.full(count, -1, dtype=np.int64)
+    genuine_sq = np.full(count, np.inf, dtype=np.float32)
+    duplicate_sq = duplicate_distance * duplicate_distance
+    pairs = {}
+
+    def update(rows, tile, same, offset):
+        # Fold one tile into the per-row minima of `rows`; tile columns start at `offset`
+        impostor = np.where(same, np.inf, tile)
+        best = np.argmin(impostor, axis=1)
+        best_sq = impostor[np.arange(len(best)), best]
+        better = best_sq < impostor_sq[rows]
+        target = np.arange(rows.start, rows.stop)[better]
+        impostor_sq[target] = best_sq[better]
+        impostor_row[target] = best[better] + offset
+        genuine = np.where(same, tile, np.inf).min(axis=1)
+        np.minimum(genuine_sq[rows], genuine, out=genuine_sq[rows])
+
+    for start in range(0, count, block_size):
+        rows = slice(start, min(start + block_size, count))
+        queries = encodings[rows]
+        for col_start in range(start, count, block_size):
+            cols = slice(col_start, min(col_start + block_size, count))
+            tile = sq_norms[rows][:, None] + sq_norms[cols][None, :]
+            tile -= 2.0 * (queries @ encodings[cols].T)
+            np.maximum(tile, 0.0, out=tile)
+            same = labels[rows][:, None] == labels[cols][None, :]
+            if col_start == start:
+                # A row is not its own neighbour, and pairs below the diagonal come from the other side
+                np.fill_diagonal(tile, np.inf)
+            update(rows, tile, same, col_start)
+            if col_start != start:
+                update(cols, tile.T, same.T, start)
+
+            close = (tile < duplicate_sq) & ~same
+            if col_start == start:
+                close = np.triu(close, k=1)
+            for i, j in zip(*np.nonzero(close)):
+                a, b = labels[start + i], labels[col_start + j]
+                key = (a, b) if a < b else (b, a)
+                if tile[i, j] < pairs.get(key, np.inf):
+                    pairs[key] = float(tile[i, j])
+            if len(pairs) > 2 * max_pairs:
+                pairs = dict(sorted(pairs.items(), key=lambda item: item[1])[:max_pairs])
+    if len(pairs) > max_pairs:
+        pairs = dict(sorted(pairs.items(), key=lambda item: item[1])[:max_pairs])
+    return impostor_sq, impostor_row, genuine_sq, pairs
+
+
+def suggest_tolerance(impostor, genuine):
+    """Pick a match tolerance from nearest-impostor and same-student distances.
+
+    Stays below the closest IMPOSTOR_QUANTILE percent of impostors; when the
+    gallery has several templates per student and their spread fits below
+    that, takes the midpoint between the two. Without such students there
+    is no evidence for going above the library default.
+    """
+    if len(impostor) == 0:
+        return DEFAULT_TOLERANCE
+    impostor_floor = float(np.percentile(impostor, IMPOSTOR_QUANTILE))
+    if len(genuine) == 0:
+        return round(min(impostor_floor, DEFAULT_TOLERANCE), 3)
+    genuine_ceiling = float(np.percentile(genuine, GENUINE_QUANTILE))
+    if genuine_ceiling < impostor_floor:
+        return round((genuine_ceiling + impostor_floor) / 2.0, 3)
+    return round(impostor_floor, 3)
+
+
+def audit_gallery(encodings, ids, tolerance=DEFAULT_TOLERANCE, duplicate_distance=DUPLICATE_DISTANCE,
+                  block_size=BLOCK_SIZE, limit=100):
+    """Health report for a gallery given as (N, 128) encodings and their ids.
+
+    - duplicates: pairs of students with templates closer than
+      duplicate_distance, probably one person enrolled under two rolls
+    - outliers: templates further than tolerance from all of their
+      student's other templates, or closer to another student than to any
+      of their own, probably a wrong photo
+    - margins: per student, the nearest other student and how far inside
+      (negative) or outside the tolerance they are, lowest first
+    - suggested_tolerance: see suggest_tolerance(), leaving out the
+      students flagged above
+
+    Lists are cut to `limit` entries (0 keeps all).
+    """
+    start = time.perf_counter()
+    ids = list(ids)
+    identities, labels = np.unique(np.asarray(ids, dtype=object).astype(str), return_inverse=True)
+    identities = identities.tolist()
+    impostor_sq, impostor_row, genuine_sq, pairs = nearest_neighbours(encodings, labels, duplicate_distance,
+                                                                       block_size)
+    impostor = np.sqrt(impostor_sq)
+    genuine = np.sqrt(genuine_sq)
+    has_impostor = impostor_row >= 0
+    has_genuine = np.isfinite(genuine)
+
+    duplicates = [{'a': identities[a], 'b': identities[b], 'distance': round(float(np.sqrt(sq)), 4)}
+                  for (a, b), sq in sorted(pairs.items(), key=lambda item: item[1])]
+
+    outlier_rows = has_genuine & ((genuine > tolerance) | (has_impostor & (impostor < genuine)))
+    outliers = []
+    for row in np.nonzero(outlier_rows)[0]:
+        entry = {'id': identities[labels[row]], 'row': int(row), 'own_distance': round(float(genuine[row]), 4),
+                 'reason': 'far_from_own' if genuine[row] > tolerance else 'closer_to_other'}
+        if has_impostor[row]:
+            entry.update(impostor=identities[labels[impostor_row[row]]], impostor_distance=round(float(impostor[row]), 4))
+        outliers.append(entry)
+    outliers.sort(key=lambda entry: entry['own_distance'] - entry.get('impostor_distance', np.inf))
+
+    # Per student: the template whose nearest impostor is closest, and the largest own spread
+    order = np.lexsort((impostor, labels))
+    _, first = np.unique(labels[order], return_index=True)
+    templates = np.bincount(labels, minlength=len(identities))
+    spread = np.full(len(identities), -np.inf)
+    np.maximum.at(spread, labels[has_genuine], genuine[has_genuine])
+    margins = []
+    for row in order[first]:
+        if not has_impostor[row]:
+            continue
+        label = labels[row]
+        margins.append({
+            'id': identities[label],
+            'templates': int(templates[label]),
+            'nearest_impostor': identities[labels[impostor_row[row]]],
+            'impostor_distance': round(float(impostor[row]), 4),
+            'spread': round(float(spread[label]), 4) if spread[label] > -np.inf else None,
+            'margin': round(float(impostor[row]) - tolerance, 4),
+        })
+    margins.sort(key=lambda entry: entry['margin'])
+    per_identity_impostor = np.array([entry['impostor_distance'] for entry in margins])
+    # Flagged students would drag the suggestion down to their own bad distances
+    flagged = {entry['id'] for entry in outliers}
+    flagged.update(entry[side] for entry in duplicates for side in ('a', 'b'))
+    clean_impostor = np.array([entry['impostor_distance'] for entry in margins if entry['id'] not in flagged])
+
+    if limit:
+        duplicates, outliers, margins = duplicates[:limit], outliers[:limit], margins[:limit]
+    return {
+        'faces': len(ids),
+        'identities': len(identities),
+        'tolerance': tolerance,
+        'duplicate_distance': duplicate_distance,
+        'suggested_tolerance': suggest_tolerance(clean_impostor, genuine[has_genuine & ~outlier_rows]),
+        'impostor_distances': _summary(per_identity_impostor),
+        'genuine_distances': _summary(genuine[has_genuine]),
+        'at_risk': int(np.count_nonzero(per_identity_impostor <= tolerance)),
+        'duplicates': duplicates,
+        'outliers': outliers,
+        'margins': margins,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate students and weak templates in the face gallery")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--duplicate-distance", type=float, default=DUPLICATE_DISTANCE)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--limit", type=int, default=20, help="entries per list in the output (0 for all)")
+    parser.add_argument("--out", help="also write the full report as JSON")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(os.path.join(args.data_dir, "face_encodings"))
+    if not store.exists():
+        parser.error(f"No embedding store in {args.data_dir}")
+    known_faces = store.load()
+    report = audit_gallery(known_faces.encodings, known_faces.ids, args.tolerance, args.duplicate_distance,
+                           args.block_size, limit=0 if args.out else args.limit)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=4)
+
+    print(f"{report['faces']} templates of {report['identities']} students audited in {report['seconds']:.1f}s")
+    for entry in report['duplicates'][:args.limit or None]:
+        print(f"  possible duplicate: {entry['a']} and {entry['b']} ({entry['distance']:.3f})")
+    for entry in report['outliers'][:args.limit or None]:
+        print(f"  outlier template: {entry['id']} row {entry['row']} ({entry['reason']}, "
+              f"{entry['own_distance']:.3f} from own)")
+    print(f"{report['at_risk']} students have another student within the tolerance of {report['tolerance']}")
+    for entry in report['margins'][:args.limit or None]:
+        if entry['margin'] > 0:
+            break
+        print(f"  {entry['id']}: {entry['nearest_impostor']} at {entry['impostor_distance']:.3f}")
+    print(f"Suggested tolerance: {report['suggested_tolerance']} (set FACE_TOLERANCE)")
+
+
+if __name__ == '__main__':
+    main()
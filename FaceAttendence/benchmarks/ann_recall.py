@@ -0,0 +1,57 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from synthetic import synthetic_gallery, synthetic_queries
+from gallery import FaceGallery
+from ann_index import IVFFlatIndex
+
+
+def time_matches(known_faces, queries, batch):
+    start = time.perf_counter()
+    rolls = []
+    for i in range(0, len(queries), batch):
+        rolls.extend(roll for roll, _ in known_faces.match(queries[i:i + batch], tolerance=np.inf))
+    elapsed = time.perf_counter() - start
+    return rolls, elapsed * 1000.0 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of the IVF index against the exact scan")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--batch", type=int, default=4, help="faces matched per call, like one frame")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        encodings, ids = synthetic_gallery(size)
+        queries, _ = synthetic_queries(encodings, args.queries)
+        known_faces = FaceGallery(encodings, ids)
+        exact, exact_ms = time_matches(known_faces, queries, args.batch)
+        print(f"N={size:>7}  exact          {exact_ms:8.3f} ms/face  recall@1 1.000")
+        results.append({"size": size, "backend": "exact", "ms_per_face": exact_ms, "recall": 1.0})
+
+        start = time.perf_counter()
+        known_faces.attach_index(IVFFlatIndex())
+        train_s = time.perf_counter() - start
+        print(f"N={size:>7}  ivf trained in {train_s:.2f}s with {known_faces.index.centroids.shape[0]} lists")
+        for nprobe in args.nprobe:
+            known_faces.index.nprobe = nprobe
+            approx, approx_ms = time_matches(known_faces, queries, args.batch)
+            recall = float(np.mean([a == b for a, b in zip(approx, exact)]))
+            print(f"N={size:>7}  ivf nprobe={nprobe:<3} {approx_ms:8.3f} ms/face  recall@1 {recall:.3f}")
+            results.append({"size": size, "backend": "ivf", "nprobe": nprobe, "ms_per_face": approx_ms,
+                            "recall": recall, "train_s": train_s})
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
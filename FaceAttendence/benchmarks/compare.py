@@ -0,0 +1,41 @@
+import argparse
+import json
+
+# Fields that identify a row within a section of run_suite.py output
+KEY_FIELDS = ('size', 'faces', 'clients')
+
+
+def rows_by_key(section):
+    return {tuple((field, row[field]) for field in KEY_FIELDS if field in row): row for row in section}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two run_suite.py result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--metric", default="p50_ms")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+    print(f"baseline  {baseline['environment'].get('commit')}")
+    print(f"candidate {candidate['environment'].get('commit')}")
+
+    for section in ('matching', 'gallery_load', 'enrolment', 'frames'):
+        if section not in baseline or section not in candidate:
+            continue
+        old_rows = rows_by_key(baseline[section])
+        for key, new in rows_by_key(candidate[section]).items():
+            old = old_rows.get(key)
+            if old is None:
+                continue
+            label = " ".join(f"{field}={value}" for field, value in key)
+            change = (new[args.metric] - old[args.metric]) / old[args.metric] * 100.0
+            print(f"{section:<13} {label:<24} {old[args.metric]:10.3f} -> {new[args.metric]:10.3f} "
+                  f"{args.metric} ({change:+.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import synthetic  # noqa: F401  (puts the app directory on sys.path)
+from detection import detect_faces
+from tracking import box_iou
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def load_fixtures(directory, limit):
+    frames = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(os.path.join(directory, filename))
+            if frame is not None:
+                frames.append((filename, frame))
+        if limit and len(frames) >= limit:
+            break
+    return frames
+
+
+def recall(reference, found, threshold=0.5):
+    if not reference:
+        return None
+    if not found:
+        return 0.0
+    iou = box_iou(reference, found)
+    return float(np.mean(iou.max(axis=1) >= threshold))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection latency and recall at each DETECTION_SCALE")
+    parser.add_argument("--images", default=os.path.join("data", "images"),
+                        help="directory of camera frames (use frames from the camera being tuned)")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.35, 0.25])
+    parser.add_argument("--min-face-size", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N images")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    frames = load_fixtures(args.images, args.limit)
+    if not frames:
+        parser.error(f"no images found in {args.images}")
+
+    # Full-resolution detection is the reference the other scales are scored against
+    reference = {name: detect_faces(frame) for name, frame in frames}
+    faces = sum(len(boxes) for boxes in reference.values())
+    print(f"{len(frames)} images, {faces} reference faces")
+
+    results = []
+    for scale in args.scales:
+        latencies = []
+        recalls = []
+        for name, frame in frames:
+            start = time.perf_counter()
+            found = detect_faces(frame, scale=scale, min_face_size=args.min_face_size)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            score = recall(reference[name], found)
+            if score is not None:
+                recalls.append(score)
+        row = {
+            "scale": scale,
+            "mean_ms": float(np.mean(latencies)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "recall": float(np.mean(recalls)) if recalls else None,
+        }
+        results.append(row)
+        recall_text = f"{row['recall']:.3f}" if row['recall'] is not None else "  n/a"
+        print(f"scale {scale:<5} mean {row['mean_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms  recall {recall_text}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
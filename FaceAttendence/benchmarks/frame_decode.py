@@ -0,0 +1,66 @@
+import argparse
+import base64
+import json
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def make_jpeg(width, height, quality, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noise = rng.integers(0, 32, size=base.shape)
+    frame = np.clip(base + noise, 0, 255).astype(np.uint8)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+# Same decode steps as demo.frame_data_to_bytes + demo.decode_image_bytes (/process_frame)
+# and demo.decode_frame_bytes (/process_frame_raw),
+# repeated here so the benchmark does not initialise the whole app
+def json_data_url_path(payload):
+    frame_data = json.loads(payload)['image']
+    if ',' in frame_data:
+        frame_data = frame_data.split(',')[1]
+    image = Image.open(BytesIO(base64.b64decode(frame_data)))
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+
+def raw_bytes_path(payload):
+    return cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def time_path(decode, payload, repeat):
+    decode(payload)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(payload)
+    return (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame decode cost of /process_frame vs /process_frame_raw")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    jpeg = make_jpeg(args.width, args.height, args.quality)
+    data_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode('ascii')
+    json_payload = json.dumps({"image": data_url})
+
+    old_ms = time_path(json_data_url_path, json_payload, args.repeat)
+    new_ms = time_path(raw_bytes_path, jpeg, args.repeat)
+    print(f"frame {args.width}x{args.height} q={args.quality}")
+    print(f"json/base64/PIL  {len(json_payload):>8} bytes  {old_ms:7.3f} ms/frame")
+    print(f"raw/imdecode     {len(jpeg):>8} bytes  {new_ms:7.3f} ms/frame")
+    print(f"speedup {old_ms / new_ms:.2f}x, {100.0 * (1 - len(jpeg) / len(json_payload)):.1f}% fewer bytes on the wire")
+
+
+if __name__ == '__main__':
+    main()
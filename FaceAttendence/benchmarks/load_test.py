@@ -0,0 +1,97 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from run_suite import environment, load_frames, percentiles
+
+
+def run_load(url, frames, concurrency, duration):
+    """Keep `concurrency` clients posting frames to url for `duration` seconds."""
+    target = urlsplit(url)
+    path = (target.path.rstrip('/') or '') + '/process_frame_raw'
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        mine = []
+        codes = Counter()
+        i = 0
+        while time.perf_counter() < deadline:
+            payload = frames[(index + i) % len(frames)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                connection.request('POST', path, body=payload,
+                                   headers={'Content-Type': 'application/octet-stream',
+                                            'X-Session-Id': f"load-{index}"})
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                codes['connection_error'] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            if response.status == 200 and 'error' in json.loads(body):
+                codes['error'] += 1
+            else:
+                codes[response.status] += 1
+                if response.status == 200:
+                    mine.append(elapsed_ms)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            statuses.update(codes)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    row = percentiles(latencies) if latencies else {}
+    row.update(concurrency=concurrency, ok=len(latencies), sustained_rps=len(latencies) / elapsed,
+               statuses={str(code): count for code, count in sorted(statuses.items(), key=str)})
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test running servers, e.g. Flask against ASGI")
+    parser.add_argument("--target", action="append", required=True,
+                        help="label=url of a running server, e.g. asgi=http://127.0.0.1:8000 (repeatable)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--images", help="fixture frames with faces (default: synthetic face-free frames)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--out", default="load_results.json")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.width, args.height)
+    report = {'environment': environment(), 'config': vars(args), 'targets': {}}
+    for target in args.target:
+        label, _, url = target.partition('=')
+        if not url:
+            label, url = target, target
+        rows = report['targets'][label] = []
+        for concurrency in args.concurrency:
+            row = run_load(url, frames, concurrency, args.duration)
+            rows.append(row)
+            print(f"{label:<8} concurrency={concurrency:<4} {row['sustained_rps']:8.2f} req/s  "
+                  f"p50 {row.get('p50_ms', 0):8.2f} ms  p99 {row.get('p99_ms', 0):8.2f} ms  {row['statuses']}")
+
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from synthetic import synthetic_gallery, synthetic_queries
+from gallery import FaceGallery
+from embedding_store import EmbeddingStore
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+    }
+
+
+def timed(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return percentiles(samples)
+
+
+def bench_matching(sizes, repeat):
+    results = []
+    for size in sizes:
+        encodings, ids = synthetic_gallery(size)
+        known_faces = FaceGallery(encodings, ids)
+        for faces in (1, 4, 16):
+            queries, _ = synthetic_queries(encodings, faces)
+            row = timed(lambda: known_faces.match(queries), repeat)
+            row.update(size=size, faces=faces)
+            results.append(row)
+            print(f"match      N={size:>7} faces={faces:<3} p50 {row['p50_ms']:8.3f} ms")
+    return results
+
+
+def bench_gallery_load(sizes, workdir, repeat):
+    results = []
+    for size in sizes:
+        encodings, ids = synthetic_gallery(size)
+        store = EmbeddingStore(os.path.join(workdir, f"load_{size}"))
+        store.write(FaceGallery(encodings, ids))
+        row = timed(store.load, repeat)
+        row.update(size=size)
+        results.append(row)
+        print(f"load       N={size:>7}           p50 {row['p50_ms']:8.3f} ms")
+    return results
+
+
+def bench_enrolment(sizes, workdir, repeat):
+    # Gallery and store update done per registration, without the dlib encoding step
+    results = []
+    for size in sizes:
+        encodings, ids = synthetic_gallery(size)
+        store = EmbeddingStore(os.path.join(workdir, f"enrol_{size}"))
+        store.write(FaceGallery(encodings, ids))
+        known_faces = store.load()
+        counter = iter(range(10 ** 9))
+
+        def enrol():
+            face_id = f"new{next(counter)}"
+            known_faces.add(encodings[0], face_id)
+            store.append(encodings[0], face_id)
+
+        row = timed(enrol, repeat)
+        row.update(size=size)
+        results.append(row)
+        print(f"enrol      N={size:>7}           p50 {row['p50_ms']:8.3f} ms")
+    return results
+
+
+def load_frames(images_dir, width, height):
+    import cv2
+    frames = []
+    if images_dir:
+        for filename in sorted(os.listdir(images_dir)):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                frame = cv2.imread(os.path.join(images_dir, filename))
+                if frame is not None:
+                    frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+    if not frames:
+        # Face-free frames still exercise decode, detection and the request path
+        rng = np.random.default_rng(0)
+        for _ in range(8):
+            frame = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+            frame = cv2.GaussianBlur(frame, (15, 15), 0)
+            frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+    return frames
+
+
+def start_app(workdir, gallery_size):
+    """Import demo.py against a throwaway data directory holding a synthetic gallery."""
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(os.path.join(data_dir, "images"), exist_ok=True)
+    encodings, ids = synthetic_gallery(gallery_size)
+    EmbeddingStore(os.path.join(data_dir, "face_encodings")).write(FaceGallery(encodings, ids))
+    # The gallery has no source images, so the startup sync must not prune it
+    os.environ["GALLERY_SYNC_ON_START"] = "0"
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+    demo = importlib.import_module("demo")
+    demo.create_app()
+    return demo
+
+
+def bench_frames(demo, frames, clients_list, frames_per_client):
+    results = []
+    for clients in clients_list:
+        latencies = []
+        lock = threading.Lock()
+
+        def client(index):
+            test_client = demo.app.test_client()
+            mine = []
+            for i in range(frames_per_client):
+                payload = frames[(index + i) % len(frames)]
+                start = time.perf_counter()
+                response = test_client.post('/process_frame_raw', data=payload,
+                                            headers={'Content-Type': 'application/octet-stream',
+                                                     'X-Session-Id': f"bench-{index}"})
+                mine.append((time.perf_counter() - start) * 1000.0)
+                if response.status_code != 200 or 'error' in response.get_json():
+                    raise RuntimeError(f"Frame failed: {response.get_data(as_text=True)}")
+            with lock:
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        row = percentiles(latencies)
+        row.update(clients=clients, frames=len(latencies), throughput_fps=len(latencies) / elapsed)
+        results.append(row)
+        print(f"frames     clients={clients:<3}        p50 {row['p50_ms']:8.2f} ms  "
+              f"p95 {row['p95_ms']:8.2f} ms  {row['throughput_fps']:7.2f} frames/s")
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline CPU benchmarks for the recognition pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--frames-per-client", type=int, default=10)
+    parser.add_argument("--app-gallery-size", type=int, default=10000)
+    parser.add_argument("--images", help="fixture frames with faces (default: synthetic face-free frames)")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--skip-frames", action="store_true",
+                        help="skip the end-to-end frame benchmarks, which need face_recognition")
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    cwd = os.getcwd()
+    report = {'environment': environment(), 'config': vars(args)}
+    with tempfile.TemporaryDirectory() as workdir:
+        report['matching'] = bench_matching(args.sizes, args.repeat)
+        report['gallery_load'] = bench_gallery_load(args.sizes, workdir, max(5, args.repeat // 5))
+        report['enrolment'] = bench_enrolment(args.sizes, workdir, args.repeat)
+        if not args.skip_frames:
+            frames = load_frames(args.images, args.width, args.height)
+            demo = start_app(workdir, args.app_gallery_size)
+            try:
+                report['frames'] = bench_frames(demo, frames, args.clients, args.frames_per_client)
+            finally:
+                demo.attendance_journal.stop()
+                os.chdir(cwd)
+
+    with open(out, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {out}")
+
+
+if __name__ == '__main__':
+    main()
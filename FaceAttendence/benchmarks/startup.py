@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from synthetic import synthetic_gallery
+from gallery import FaceGallery
+from embedding_store import EmbeddingStore
+from rebuild import save_manifest, scan_images
+from run_suite import APP_DIR, environment
+
+# Runs in a fresh interpreter so nothing is already imported or loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import demo
+imported = time.perf_counter()
+demo.create_app()
+created = time.perf_counter()
+client = demo.app.test_client()
+while client.get('/ready').status_code != 200 and time.perf_counter() - created < 300:
+    time.sleep(0.01)
+ready = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'create_app_s': created - imported, 'ready_s': ready - start,
+                  'error': demo.readiness['error']}))
+demo.attendance_journal.stop()
+"""
+
+
+def prepare_data_dir(workdir, size):
+    """A data directory whose store and manifest already match its (placeholder) images."""
+    data_dir = os.path.join(workdir, "data")
+    images_dir = os.path.join(data_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    encodings, ids = synthetic_gallery(size)
+    EmbeddingStore(os.path.join(data_dir, "face_encodings")).write(FaceGallery(encodings, ids))
+    for face_id in ids:
+        with open(os.path.join(images_dir, f"{face_id}.png"), 'wb') as file:
+            file.write(face_id.encode('ascii'))
+    # Marked as already encoded, so the startup sync only checks them
+    manifest = {filename: dict(stat, sha1=None, face=True) for filename, stat in scan_images(images_dir).items()}
+    save_manifest(os.path.join(data_dir, "face_manifest.json"), manifest)
+    return data_dir
+
+
+def run_probe(workdir):
+    result = subprocess.run([sys.executable, '-c', PROBE, APP_DIR], cwd=workdir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app startup with and without the gallery snapshot")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default="startup_results.json")
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'config': vars(args), 'startup': []}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            data_dir = prepare_data_dir(workdir, size)
+            snapshot_path = os.path.join(data_dir, "face_snapshot.json")
+            for mode in ('sync', 'snapshot'):
+                samples = []
+                for _ in range(args.repeat):
+                    # The first start in sync mode writes the snapshot the later mode starts from
+                    if mode == 'sync' and os.path.exists(snapshot_path):
+                        os.remove(snapshot_path)
+                    samples.append(run_probe(workdir))
+                row = {'size': size, 'mode': mode, 'error': samples[-1]['error']}
+                for key in ('import_s', 'create_app_s', 'ready_s'):
+                    row[key] = float(np.median([sample[key] for sample in samples]))
+                report['startup'].append(row)
+                print(f"startup    N={size:>7} {mode:<9} import {row['import_s']:6.2f}s  "
+                      f"create_app {row['create_app_s']:6.2f}s  ready {row['ready_s']:6.2f}s")
+
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
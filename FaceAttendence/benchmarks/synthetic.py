@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+
+# Benchmarks import the app modules the same way demo.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENCODING_SIZE = 128
+# Roughly matches dlib encodings: different people sit ~0.9 apart and a new
+# capture of an enrolled person lands ~0.35 from their stored encoding
+IDENTITY_SPREAD = 0.9 / np.sqrt(2 * ENCODING_SIZE)
+CAPTURE_NOISE = 0.35 / np.sqrt(ENCODING_SIZE)
+
+
+def synthetic_gallery(count, seed=0, groups=64):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0.0, IDENTITY_SPREAD, size=(groups, ENCODING_SIZE))
+    members = rng.integers(0, groups, size=count)
+    encodings = centers[members] + rng.normal(0.0, IDENTITY_SPREAD, size=(count, ENCODING_SIZE))
+    ids = [f"S{i:06d}" for i in range(count)]
+    return encodings.astype(np.float32), ids
+
+
+def synthetic_queries(encodings, count, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, encodings.shape[0], size=count)
+    queries = encodings[rows] + rng.normal(0.0, CAPTURE_NOISE, size=(count, ENCODING_SIZE))
+    return queries.astype(np.float32), rows
@@ -0,0 +1,232 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import queue
+import sqlite3
+import time
+
+from attendance_log import AttendanceJournal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    roll TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    class_id INTEGER NOT NULL REFERENCES classes(id),
+    started_at REAL NOT NULL,
+    ended_at REAL
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    roll TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (session_id, roll)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_class_started ON sessions (class_id, started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions (started_at, id);
+CREATE INDEX IF NOT EXISTS idx_attendance_roll_seen ON attendance (roll, seen_at);
+"""
+
+DEFAULT_CLASS = "default"
+
+
+class ConnectionPool:
+    """Fixed set of SQLite connections in WAL mode shared by request threads."""
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self._pool = queue.Queue()
+        for _ in range(size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+class AttendanceDatabase:
+    def __init__(self, path, pool_size=4):
+        self.created = not os.path.exists(path)
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    # Students
+
+    def add_student(self, roll, name):
+        """Insert a student, or rename one already listed (e.g. from students.csv)."""
+        with self.pool.connection() as conn:
+            conn.execute("""
+                INSERT INTO students (roll, name, created_at) VALUES (?, ?, ?)
+                ON CONFLICT (roll) DO UPDATE SET name = excluded.name
+            """, (roll, name, time.time()))
+
+    def import_students(self, rows):
+        # A real name replaces the roll-number placeholder given to enrolled ids without one
+        query = """
+            INSERT INTO students (roll, name, created_at) VALUES (?, ?, ?)
+            ON CONFLICT (roll) DO UPDATE SET name = excluded.name
+            WHERE students.name = students.roll AND excluded.name != excluded.roll
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.executemany(query, ((roll, name, time.time()) for roll, name in rows))
+            return cursor.rowcount
+
+    def roll_to_name(self):
+        with self.pool.connection() as conn:
+            return dict(conn.execute("SELECT roll, name FROM students"))
+
+    # Sessions and attendance
+
+    def _class_id(self, conn, class_name):
+        conn.execute("INSERT OR IGNORE INTO classes (name) VALUES (?)", (class_name,))
+        return conn.execute("SELECT id FROM classes WHERE name = ?", (class_name,)).fetchone()[0]
+
+    def write_events(self, events):
+        """Apply attendance journal events (see attendance_log) in one transaction."""
+        with self.pool.connection() as conn:
+            for event in events:
+                kind = event.get('event')
+                if kind == 'start':
+                    class_id = self._class_id(conn, event.get('class') or DEFAULT_CLASS)
+                    conn.execute("INSERT OR IGNORE INTO sessions (id, class_id, started_at) VALUES (?, ?, ?)",
+                                 (event['session'], class_id, event['ts']))
+                elif kind == 'present':
+                    if conn.execute("SELECT 1 FROM sessions WHERE id = ?", (event['session'],)).fetchone() is None:
+                        class_id = self._class_id(conn, event.get('class') or DEFAULT_CLASS)
+                        conn.execute("INSERT INTO sessions (id, class_id, started_at) VALUES (?, ?, ?)",
+                                     (event['session'], class_id, event['ts']))
+                    conn.execute("INSERT OR IGNORE INTO attendance (session_id, roll, seen_at) VALUES (?, ?, ?)",
+                                 (event['session'], event['roll'], event['ts']))
+                elif kind == 'clear':
+                    conn.execute("UPDATE sessions SET ended_at = ? WHERE id = ? AND ended_at IS NULL",
+                                 (event['ts'], event['session']))
+
+    def attendance_page(self, class_name=None, roll=None, start=None, end=None, after=None, limit=1000):
+        """One page of attendance records, ordered by (started_at, session_id, roll).
+
+        Returns up to limit rows of (session_id, class, started_at, roll, name,
+        seen_at) for sessions started between start and end. `after` is the
+        (started_at, session_id, roll) of the last row of the previous page, so
+        each page is a fresh index seek and no connection is held in between.
+        """
+        clauses = ["s.started_at >= ?", "s.started_at < ?"]
+        params = [start if start is not None else float('-inf'), end if end is not None else float('inf')]
+        if class_name is not None:
+            clauses.append("c.name = ?")
+            params.append(class_name)
+        if roll is not None:
+            clauses.append("a.roll = ?")
+            params.append(roll)
+        if after is not None:
+            clauses.append("(s.started_at, s.id, a.roll) > (?, ?, ?)")
+            params.extend(after)
+        query = f"""
+            SELECT s.id, c.name, s.started_at, a.roll, st.name, a.seen_at
+            FROM sessions s
+            JOIN classes c ON c.id = s.class_id
+            JOIN attendance a ON a.session_id = s.id
+            LEFT JOIN students st ON st.roll = a.roll
+            WHERE {' AND '.join(clauses)}
+            ORDER BY s.started_at, s.id, a.roll
+            LIMIT ?
+        """
+        with self.pool.connection() as conn:
+            return conn.execute(query, params + [limit]).fetchall()
+
+def import_data_dir(db, data_dir):
+    """Import students.csv, attendance.json, the attendance journal and enrolled ids."""
+    counts = {'students': 0, 'enrolled_without_name': 0, 'snapshot': 0, 'events': 0}
+
+    csv_path = os.path.join(data_dir, 'students.csv')
+    if os.path.exists(csv_path):
+        with open(csv_path, 'r') as file:
+            rows = [(row[0], row[1]) for row in csv.reader(file) if len(row) >= 2]
+        counts['students'] = db.import_students(rows)
+
+    # Encoded students missing from the CSV still get a row, named after their roll
+    ids_path = os.path.join(data_dir, 'face_encodings_ids.txt')
+    pickle_path = os.path.join(data_dir, 'face_encodings.pkl')
+    ids = []
+    if os.path.exists(ids_path):
+        with open(ids_path, 'r', encoding='utf-8') as file:
+            ids = [line.rstrip('\n') for line in file]
+    elif os.path.exists(pickle_path):
+        import pickle
+        with open(pickle_path, 'rb') as file:
+            ids = list(pickle.load(file)[1])
+    counts['enrolled_without_name'] = db.import_students((face_id, face_id) for face_id in ids)
+
+    snapshot_path = os.path.join(data_dir, 'attendance.json')
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'r') as file:
+            snapshot = json.load(file)
+        started = time.mktime(time.strptime(f"{snapshot['date']} {snapshot['time']}", '%Y-%m-%d %H:%M:%S'))
+        session = snapshot.get('session') or f"snapshot-{snapshot['date']}-{snapshot['time']}"
+        events = [{'event': 'start', 'session': session, 'class': DEFAULT_CLASS, 'ts': started}]
+        events.extend({'event': 'present', 'session': session, 'roll': student['roll'], 'ts': started}
+                      for student in snapshot.get('present', []))
+        db.write_events(events)
+        counts['snapshot'] = len(events) - 1
+
+    # Rotated journals hold the older events, oldest first
+    log_path = os.path.join(data_dir, 'attendance_log.jsonl')
+    archives = AttendanceJournal(log_path).archives() if os.path.isdir(data_dir) else []
+    for path in archives + [log_path]:
+        if not os.path.exists(path):
+            continue
+        batch = []
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    continue
+                if len(batch) >= 10000:
+                    db.write_events(batch)
+                    counts['events'] += len(batch)
+                    batch = []
+        db.write_events(batch)
+        counts['events'] += len(batch)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance database tools")
+    parser.add_argument("command", choices=["import"])
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+
+    db = AttendanceDatabase(os.path.join(args.data_dir, "attendance.db"))
+    counts = import_data_dir(db, args.data_dir)
+    print(f"Imported {counts['students']} students from CSV, {counts['enrolled_without_name']} enrolled ids "
+          f"without a CSV row, {counts['snapshot']} snapshot records and {counts['events']} journal events.")
+
+
+if __name__ == '__main__':
+    main()
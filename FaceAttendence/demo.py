@@ -1,16 +1,40 @@
 import cv2
-import face_recognition
 import os
 import time
 import csv
-import pickle
 import json
 import base64
+import tempfile
+import zipfile
+import threading
+import atexit
 import numpy as np
 from flask import Flask, jsonify, request, render_template_string, Response
 from io import BytesIO
 from PIL import Image
 import io
+from gallery import FaceGallery, DEFAULT_TOLERANCE
+from audit import audit_gallery
+from embedding_store import EmbeddingStore
+from ann_index import IVFFlatIndex, gallery_fingerprint
+from inference_pool import InferencePool
+from tracking import FaceTracker
+from detection import detect_faces, encode_faces, face_yaw, load_models, parse_roi
+from rebuild import rebuild_gallery
+from snapshot import GallerySnapshot
+from enrol import DUPLICATE_DISTANCE, read_roster, list_photos, encode_roster, save_photos, valid_roll
+from attendance_log import AttendanceJournal, new_session_id
+from database import AttendanceDatabase, DEFAULT_CLASS, import_data_dir
+from metrics import Metrics, FrameProfiler
+from sessions import ClassroomSession, SessionRegistry, DEFAULT_SESSION
+from stream_ingest import StreamManager, parse_sources, source_allowed
+from events import Broadcaster
+from frame_gate import FrameGate, dhash
+from quality import FaceQualityGate
+from image_writer import ImageWriter
+from reports import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, csv_chunks, decode_cursor, encode_cursor,
+                     format_record, iter_pages, jsonl_chunks, parse_time)
+from recognition_cache import RecognitionCache
 
 app = Flask(__name__)
 
@@ -18,14 +42,140 @@ app = Flask(__name__)
 DATA_DIR = "data"
 IMAGES_DIR = os.path.join(DATA_DIR, "images")
 pickle_file = os.path.join(DATA_DIR, "face_encodings.pkl")
+face_store = EmbeddingStore(os.path.join(DATA_DIR, "face_encodings"))
 attendance_file = os.path.join(DATA_DIR, "attendance.json")
+attendance_log_file = os.path.join(DATA_DIR, "attendance_log.jsonl")
 csv_file = os.path.join(DATA_DIR, 'students.csv')
-
-known_face_encodings = []
-known_face_ids = []
+database_file = os.path.join(DATA_DIR, "attendance.db")
+index_file = os.path.join(DATA_DIR, "face_index.npz")
+manifest_file = os.path.join(DATA_DIR, "face_manifest.json")
+snapshot_file = os.path.join(DATA_DIR, "face_snapshot.json")
+
+# Largest face distance counted as a match; GET /gallery/audit suggests one for this gallery
+MATCH_TOLERANCE = float(os.environ.get("FACE_TOLERANCE", str(DEFAULT_TOLERANCE)))
+
+# "exact" scans the whole gallery, "ivf" uses the approximate IVF-flat index
+MATCHER_BACKEND = os.environ.get("FACE_MATCHER", "exact")
+IVF_NPROBE = int(os.environ.get("FACE_MATCHER_NPROBE", "8"))
+
+# Re-encode images added, changed or removed in IMAGES_DIR since the last start
+GALLERY_SYNC_ON_START = os.environ.get("GALLERY_SYNC_ON_START", "1") == "1"
+REBUILD_WORKERS = int(os.environ.get("REBUILD_WORKERS", "0")) or None
+
+# Load the face models inside create_app() instead of in the background after it,
+# so a pre-forking server (gunicorn --preload) shares them with its workers
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS", "0") == "1"
+
+# Attendance events are written in batches by a background thread
+ATTENDANCE_FLUSH_INTERVAL = float(os.environ.get("ATTENDANCE_FLUSH_INTERVAL", "1.0"))
+ATTENDANCE_FLUSH_COUNT = int(os.environ.get("ATTENDANCE_FLUSH_COUNT", "100"))
+# Past this size the journal is archived and restarted with only the open sessions (0 never rotates)
+ATTENDANCE_LOG_ROTATE_MB = float(os.environ.get("ATTENDANCE_LOG_ROTATE_MB", "16"))
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", "4"))
+
+# Allows POST /debug/profile to run cProfile over the next N frames
+PROFILER_ENABLED = os.environ.get("ENABLE_PROFILER", "0") == "1"
+
+# 0 runs recognition in the request thread, N > 0 uses a pool of N processes
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "0"))
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "10"))
+
+# Track faces per camera session and only re-encode new, drifted or stale tracks: a track is
+# re-encoded once its box overlaps where it was last encoded by less than TRACK_DRIFT_IOU
+TRACKING_ENABLED = os.environ.get("FACE_TRACKING", "1") == "1"
+TRACK_IOU_THRESHOLD = float(os.environ.get("TRACK_IOU_THRESHOLD", "0.5"))
+TRACK_REFRESH_SECONDS = float(os.environ.get("TRACK_REFRESH_SECONDS", "10"))
+TRACK_MAX_AGE_SECONDS = float(os.environ.get("TRACK_MAX_AGE_SECONDS", "3"))
+TRACK_DRIFT_IOU = float(os.environ.get("TRACK_DRIFT_IOU", "0.7"))
+
+# State is kept per camera session (X-Session-Id); sessions idle for
+# SESSION_IDLE_MINUTES, or beyond the MAX_SESSIONS most recent, are closed
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "64"))
+SESSION_IDLE_MINUTES = float(os.environ.get("SESSION_IDLE_MINUTES", "120"))
+
+# HOG detection runs on a copy scaled by DETECTION_SCALE; encodings use the full frame
+DETECTION_OPTIONS = {
+    'scale': float(os.environ.get("DETECTION_SCALE", "1.0")),
+    'roi': parse_roi(os.environ.get("DETECTION_ROI", "")),
+    'min_face_size': int(os.environ.get("MIN_FACE_SIZE", "0")),
+}
+
+# Faces smaller, blurrier or turned further than this are not encoded (0 turns a check off).
+# The unknown face kept for registration is the best one seen in the last UNKNOWN_FACE_WINDOW seconds.
+QUALITY_MIN_FACE_SIZE = int(os.environ.get("QUALITY_MIN_FACE_SIZE", "40"))
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", "15"))
+QUALITY_MAX_YAW = float(os.environ.get("QUALITY_MAX_YAW", "0.6"))
+UNKNOWN_FACE_WINDOW = float(os.environ.get("UNKNOWN_FACE_WINDOW", "3"))
+
+# Recent matches reused for encodings within RECOGNITION_CACHE_RADIUS of a cached one
+RECOGNITION_CACHE_SIZE = int(os.environ.get("RECOGNITION_CACHE_SIZE", "512"))
+RECOGNITION_CACHE_TTL = float(os.environ.get("RECOGNITION_CACHE_TTL", "30"))
+RECOGNITION_CACHE_RADIUS = float(os.environ.get("RECOGNITION_CACHE_RADIUS", "0.1"))
+
+# Confident matches that still differ from a student's templates (a new pose or
+# lighting) are added as extra templates, at most one per AUTO_TEMPLATE_INTERVAL
+# seconds and up to MAX_TEMPLATES_PER_STUDENT per student
+AUTO_TEMPLATES = os.environ.get("AUTO_TEMPLATES", "0") == "1"
+MAX_TEMPLATES_PER_STUDENT = int(os.environ.get("MAX_TEMPLATES_PER_STUDENT", "5"))
+AUTO_TEMPLATE_MIN_DISTANCE = float(os.environ.get("AUTO_TEMPLATE_MIN_DISTANCE", "0.25"))
+AUTO_TEMPLATE_MAX_DISTANCE = float(os.environ.get("AUTO_TEMPLATE_MAX_DISTANCE", "0.4"))
+AUTO_TEMPLATE_INTERVAL = float(os.environ.get("AUTO_TEMPLATE_INTERVAL", "300"))
+
+# Skip frames showing the same scene as the camera's previous frame. The page skips
+# uploads whose thumbnail differs by less than MOTION_THRESHOLD (mean grey level,
+# 0 disables); the server reuses the last result for frames within
+# FRAME_HASH_DISTANCE bits of the previous frame's hash (negative disables)
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", "4"))
+MOTION_MAX_SKIP_SECONDS = float(os.environ.get("MOTION_MAX_SKIP_SECONDS", "10"))
+FRAME_HASH_DISTANCE = int(os.environ.get("FRAME_HASH_DISTANCE", "3"))
+FRAME_HASH_MAX_AGE = float(os.environ.get("FRAME_HASH_MAX_AGE", "10"))
+
+# Cameras read server-side, as "name=rtsp://...,name=video.mp4"
+STREAM_SOURCES = parse_sources(os.environ.get("STREAM_SOURCES", ""))
+STREAM_BUFFER_SIZE = int(os.environ.get("STREAM_BUFFER_SIZE", "2"))
+STREAM_MAX_FPS = float(os.environ.get("STREAM_MAX_FPS", "0"))
+# POST /streams may only open sources starting with one of these prefixes, e.g. "rtsp://10.0.0.5/";
+# empty (the default) allows only the sources in STREAM_SOURCES
+STREAM_ALLOWED_SOURCES = [prefix.strip() for prefix in os.environ.get("STREAM_ALLOWED_SOURCES", "").split(',')
+                          if prefix.strip()]
+
+# Events waiting per server-sent-events client before the oldest are dropped
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", "64"))
+
+known_faces = FaceGallery()
+gallery_snapshot = GallerySnapshot(snapshot_file, IMAGES_DIR, face_store)
+# Whether the store matched the images at startup; only then can shutdown vouch for it
+gallery_synced = False
+# (gallery version, index trained size) that data/face_index.npz was last saved at
+index_saved_at = (None, None)
 roll_to_name = {}
-attendance = set()
-last_unknown_face = None
+default_class = os.environ.get("ATTENDANCE_CLASS", DEFAULT_CLASS)
+attendance_journal = AttendanceJournal(attendance_log_file, ATTENDANCE_FLUSH_INTERVAL, ATTENDANCE_FLUSH_COUNT,
+                                       int(ATTENDANCE_LOG_ROTATE_MB * 1024 * 1024))
+sessions = None
+# roll -> monotonic time a live template was last added
+template_added_at = {}
+inference_pool = None
+db = None
+metrics = Metrics()
+profiler = FrameProfiler(DATA_DIR)
+recognition_cache = (RecognitionCache(RECOGNITION_CACHE_SIZE, RECOGNITION_CACHE_TTL, RECOGNITION_CACHE_RADIUS)
+                     if RECOGNITION_CACHE_SIZE > 0 else None)
+frame_gate = FrameGate(FRAME_HASH_DISTANCE, FRAME_HASH_MAX_AGE, MAX_SESSIONS)
+quality_gate = FaceQualityGate(QUALITY_MIN_FACE_SIZE, QUALITY_MIN_SHARPNESS, QUALITY_MAX_YAW, face_yaw)
+broadcaster = Broadcaster(EVENT_BUFFER_SIZE)
+streams = None
+image_writer = ImageWriter()
+
+# Serializes updates to the gallery and the student list; per-camera state uses the session's lock
+state_lock = threading.RLock()
+# One gallery audit at a time, it is O(N^2) in the number of templates
+audit_lock = threading.Lock()
+
+started = False
+startup_lock = threading.Lock()
+readiness = {'ready': False, 'error': None, 'startup_seconds': None, 'models_seconds': None}
 
 
 # Create necessary directories
@@ -34,66 +184,194 @@ def ensure_directories():
     os.makedirs(IMAGES_DIR, exist_ok=True)
 
 
+def init_database():
+    global db
+    db = AttendanceDatabase(database_file, DATABASE_POOL_SIZE)
+    if db.created:
+        counts = import_data_dir(db, DATA_DIR)
+        print(f"Created {database_file}: imported {counts['students']} students "
+              f"and {counts['events']} attendance events.")
+    attendance_journal.sinks.append(db.write_events)
+
+
 def load_roll_to_name():
     global roll_to_name
+    # Rows added to students.csv by hand are still picked up; new students go to the database
     if os.path.exists(csv_file):
         with open(csv_file, 'r') as file:
             reader = csv.reader(file)
-            for row in reader:
-                if len(row) >= 2:
-                    roll, name = row[0], row[1]
-                    roll_to_name[roll] = name
-    else:
-        # Create empty CSV file if it doesn't exist
-        with open(csv_file, 'w', newline='') as file:
-            pass
+            db.import_students((row[0], row[1]) for row in reader if len(row) >= 2)
+    roll_to_name = db.roll_to_name()
 
 
-def load_faces_from_directory():
-    face_encodings = []
-    face_ids = []
+def load_faces_from_directory(previous=None):
     try:
-        if os.path.exists(IMAGES_DIR):
-            for filename in os.listdir(IMAGES_DIR):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_path = os.path.join(IMAGES_DIR, filename)
-                    image = face_recognition.load_image_file(image_path)
-                    encodings = face_recognition.face_encodings(image)
-                    if encodings:
-                        face_encodings.append(encodings[0])
-                        person_id = os.path.splitext(filename)[0]
-                        face_ids.append(person_id)
-                        print(f"Loaded reference image for ID: {person_id}")
+        rebuilt, stats = rebuild_gallery(IMAGES_DIR, manifest_file, previous, workers=REBUILD_WORKERS)
     except Exception as e:
         print(f"Error loading images: {str(e)}")
-    return face_encodings, face_ids
+        return previous if previous is not None else FaceGallery(), None
+    changed = stats['encoded'] or stats['no_face'] or stats['deleted'] or previous is None
+    if changed:
+        print(f"Loaded {stats['encoded']} new reference images, dropped {stats['deleted']}.")
+    return rebuilt, changed
 
 
 def load_known_faces():
-    global known_face_encodings, known_face_ids
-    if os.path.exists(pickle_file):
-        with open(pickle_file, 'rb') as file:
-            known_face_encodings, known_face_ids = pickle.load(file)
-            print("Encodings loaded from file!")
+    global known_faces, gallery_synced
+    if not face_store.exists() and os.path.exists(pickle_file):
+        count = face_store.migrate_pickle(pickle_file)
+        print(f"Migrated {count} encodings from {pickle_file} to {face_store.matrix_path}.")
+    if face_store.exists():
+        # The snapshot says the store already matches the images, so there is nothing to sync
+        current = gallery_snapshot.is_current()
+        known_faces = face_store.load()
+        print("Encodings loaded from snapshot!" if current else "Encodings loaded from file!")
+        gallery_synced = current
+        if GALLERY_SYNC_ON_START and not current:
+            known_faces, changed = load_faces_from_directory(known_faces)
+            if changed:
+                save_known_faces()
+            if changed is not None:
+                gallery_snapshot.save()
+                gallery_synced = True
     else:
         print("No saved encodings found. Loading from images...")
-        known_face_encodings, known_face_ids = load_faces_from_directory()
+        known_faces, changed = load_faces_from_directory()
         save_known_faces()
+        if changed is not None:
+            gallery_snapshot.save()
+            gallery_synced = True
+    load_matcher_index()
+
+
+def load_matcher_index():
+    if MATCHER_BACKEND != "ivf":
+        return
+    index = IVFFlatIndex.load(index_file, gallery_fingerprint(known_faces.encodings, known_faces.ids))
+    global index_saved_at
+    if index is not None:
+        index.nprobe = IVF_NPROBE
+        known_faces.attach_index(index)
+        index_saved_at = (known_faces.version, index.trained_size)
+        return
+    print("Building IVF index for face matching...")
+    known_faces.attach_index(IVFFlatIndex(nprobe=IVF_NPROBE))
+    save_matcher_index()
+
+
+def save_matcher_index():
+    global index_saved_at
+    index = known_faces.index
+    if index is None or not index.trained or index_saved_at == (known_faces.version, index.trained_size):
+        return
+    index.save(index_file, gallery_fingerprint(known_faces.encodings, known_faces.ids))
+    index_saved_at = (known_faces.version, index.trained_size)
+
+
+def save_retrained_index():
+    # Rows added to the index are saved at shutdown, since saving hashes and rewrites the whole
+    # file (after a crash the fingerprint check retrains it). Only a retrain, the part that is
+    # expensive to redo at startup, is saved straight away.
+    index = known_faces.index
+    if index is not None and index.trained and index.trained_size != index_saved_at[1]:
+        save_matcher_index()
 
 
 def save_known_faces():
-    with open(pickle_file, 'wb') as file:
-        pickle.dump((known_face_encodings, known_face_ids), file)
+    face_store.write(known_faces)
+    save_matcher_index()
     print("Saved face encodings to file.")
 
 
-def save_attendance():
+def session_topic(key):
+    return f"session:{key or DEFAULT_SESSION}"
+
+
+def attendance_snapshot(key):
+    """The session's whole attendance list as an event; sent when a client connects or falls behind."""
+    session = sessions.peek(key)
+    if session is None:
+        return {'type': 'snapshot', 'session': key, 'attendance': []}
+    with session.lock:
+        return {
+            'type': 'snapshot',
+            'session': session.key,
+            'attendance_session': session.attendance_session,
+            'class': session.class_name,
+            'attendance': [
+                {'roll': roll, 'name': roll_to_name.get(roll, 'Unknown'),
+                 'time': time.strftime('%H:%M:%S', time.localtime(session.attendance[roll]))}
+                for roll in sorted(session.attendance)
+            ],
+        }
+
+
+def mark_present(session, roll):
+    # Callers hold session.lock; only the first sighting in a session is journaled
+    if roll not in session.attendance:
+        now = time.time()
+        session.attendance[roll] = now
+        attendance_journal.record_present(roll, session.attendance_session, now)
+        broadcaster.publish(session_topic(session.key), {
+            'type': 'present', 'roll': roll, 'name': roll_to_name.get(roll, 'Unknown'),
+            'time': time.strftime('%H:%M:%S', time.localtime(now)),
+            'attendance_count': len(session.attendance),
+        }, key=('present', roll))
+
+
+def new_tracker(key):
+    # Clients without a session id may be several cameras, so their faces are not tracked
+    if not TRACKING_ENABLED or key == DEFAULT_SESSION:
+        return None
+    return FaceTracker(TRACK_IOU_THRESHOLD, TRACK_REFRESH_SECONDS, TRACK_MAX_AGE_SECONDS, TRACK_DRIFT_IOU)
+
+
+def new_classroom_session(key):
+    session = ClassroomSession(key, new_session_id(), default_class, new_tracker(key))
+    attendance_journal.record_start(session.attendance_session, session.class_name, time.time(), key)
+    return session
+
+
+def close_session(session):
+    # An idle or evicted camera ends its attendance session
+    attendance_journal.record_clear(session.attendance_session, time.time())
+    metrics.forget_camera(session.key)
+    print(f"Closed session {session.key} ({len(session.attendance)} students present).")
+
+
+def load_attendance():
+    global sessions
+    sessions = SessionRegistry(new_classroom_session, MAX_SESSIONS, SESSION_IDLE_MINUTES * 60, close_session)
+    # Sessions left open by the last run carry on; an older open session of the same camera is closed
+    recovered = {}
+    for state in attendance_journal.open_sessions():
+        key = state['camera'] or DEFAULT_SESSION
+        if key in recovered:
+            attendance_journal.record_clear(recovered.pop(key)['session'], time.time())
+        recovered[key] = state
+    recovered = list(recovered.items())
+    for key, state in recovered[:-MAX_SESSIONS]:
+        # More cameras than MAX_SESSIONS: the oldest are closed rather than carried over forever
+        attendance_journal.record_clear(state['session'], time.time())
+    for key, state in recovered[-MAX_SESSIONS:]:
+        session = ClassroomSession(key, state['session'], state['class'] or default_class, new_tracker(key))
+        session.attendance = state['present']
+        sessions.add(session)
+        print(f"Recovered attendance for {len(state['present'])} students from session {state['session']}.")
+    attendance_journal.start()
+
+
+def save_attendance(session):
     attendance_data = {
         'date': time.strftime('%Y-%m-%d'),
         'time': time.strftime('%H:%M:%S'),
+        'session': session.attendance_session,
+        'class': session.class_name,
+        'camera': session.key,
         'present': [
-            {'roll': roll, 'name': roll_to_name.get(roll, 'Unknown')}
-            for roll in sorted(attendance)
+            {'roll': roll, 'name': roll_to_name.get(roll, 'Unknown'),
+             'time': time.strftime('%H:%M:%S', time.localtime(session.attendance[roll]))}
+            for roll in sorted(session.attendance)
         ]
     }
     with open(attendance_file, 'w') as file:
@@ -101,65 +379,301 @@ def save_attendance():
     print("Attendance JSON saved to file.")
 
 
-def process_frame(frame_data):
-    global attendance, last_unknown_face
-    try:
-        if ',' in frame_data:
-            frame_data = frame_data.split(',')[1]
-        image_bytes = base64.b64decode(frame_data)
-        image = Image.open(BytesIO(image_bytes))
-        frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        face_locations = face_recognition.face_locations(frame)
-        face_encodings = face_recognition.face_encodings(frame, face_locations)
-        recognized_faces = []
-        unknown_detected = False
-        for i, (top, right, bottom, left), face_encoding in zip(range(len(face_locations)), face_locations,
-                                                                face_encodings):
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-            if True in matches:
-                first_match_index = matches.index(True)
-                roll = known_face_ids[first_match_index]
+def frame_data_to_bytes(frame_data):
+    if ',' in frame_data:
+        frame_data = frame_data.split(',')[1]
+    return base64.b64decode(frame_data)
+
+
+def decode_image_bytes(image_bytes):
+    with metrics.stage('pil_decode'):
+        image = np.array(Image.open(BytesIO(image_bytes)))
+    with metrics.stage('cvt_color'):
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def decode_frame_bytes(image_bytes):
+    # imdecode reads straight from the request buffer and already returns BGR
+    with metrics.stage('imdecode'):
+        frame = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode image")
+    return frame
+
+
+def unknown_face_snapshot(frame, location, encoding):
+    """Padded crop around an unknown face with its box and encoding, kept for registration."""
+    top, right, bottom, left = location
+    pad_y, pad_x = (bottom - top) // 2, (right - left) // 2
+    y0, x0 = max(0, top - pad_y), max(0, left - pad_x)
+    y1, x1 = min(frame.shape[0], bottom + pad_y), min(frame.shape[1], right + pad_x)
+    return {'face_img': frame[y0:y1, x0:x1].copy(), 'location': (top - y0, right - x0, bottom - y0, left - x0),
+            'encoding': encoding}
+
+
+def wants_template(roll, distance, encoding, frame):
+    return (AUTO_TEMPLATES and frame is not None and encoding is not None
+            and AUTO_TEMPLATE_MIN_DISTANCE < distance <= AUTO_TEMPLATE_MAX_DISTANCE
+            and known_faces.template_count(roll) < MAX_TEMPLATES_PER_STUDENT
+            and time.monotonic() - template_added_at.get(roll, float('-inf')) >= AUTO_TEMPLATE_INTERVAL)
+
+
+def add_live_templates(candidates):
+    """Add (roll, distance, encoding, face_img) captures as extra templates, within the per-student cap."""
+    added = 0
+    with state_lock:
+        for roll, distance, encoding, face_img in candidates:
+            # Checked again under the lock: another camera may have just added one
+            if not valid_roll(roll) or not wants_template(roll, distance, encoding, face_img):
+                continue
+            template_added_at[roll] = time.monotonic()
+            known_faces.add(encoding, roll)
+            face_store.append(encoding, roll)
+            filename = f"live-{time.strftime('%Y%m%d-%H%M%S')}-{known_faces.template_count(roll)}.png"
+            image_writer.save(os.path.join(IMAGES_DIR, roll, filename), face_img)
+            added += 1
+        if added:
+            save_retrained_index()
+            if inference_pool is not None:
+                inference_pool.publish(known_faces)
+    return added
+
+
+def keep_unknown_face(session, frame, location, encoding, quality, now):
+    # Keep the best crop of the window rather than the latest, which may be mid-blink or turning away
+    current = session.last_unknown_face
+    if current is None or quality >= current['quality'] or now - current['seen'] > UNKNOWN_FACE_WINDOW:
+        session.last_unknown_face = dict(unknown_face_snapshot(frame, location, encoding), quality=quality, seen=now)
+
+
+def apply_recognition(session, frame, faces, rejected=()):
+    """Update a session's attendance from the results of one frame.
+
+    faces holds (location, roll, distance, encoding, quality) for encoded
+    faces; rejected holds (location, reason) for faces the quality gate
+    kept from being encoded.
+    """
+    metrics.set_faces(len(faces) + len(rejected))
+    recognized_faces = []
+    unknown_detected = False
+    template_candidates = []
+    now = time.monotonic()
+    with metrics.stage('apply'), session.lock:
+        session.stats['frames'] += 1
+        for (top, right, bottom, left), roll, distance, encoding, quality in faces:
+            if roll is not None:
                 name = roll_to_name.get(roll, roll)
-                attendance.add(roll)
-                recognized_faces.append(
-                    {"name": name, "roll": roll, "status": "known", "box": [left, top, right, bottom]})
+                mark_present(session, roll)
+                session.stats['known_faces'] += 1
+                if quality is not None and wants_template(roll, distance, encoding, frame):
+                    snapshot = unknown_face_snapshot(frame, (top, right, bottom, left), encoding)
+                    template_candidates.append((roll, distance, encoding, snapshot['face_img']))
+                recognized_faces.append({"name": name, "roll": roll, "status": "known",
+                                         "distance": round(distance, 4), "box": [left, top, right, bottom]})
             else:
                 unknown_detected = True
-                face_img = frame[top:bottom, left:right]
-                last_unknown_face = {'face_img': face_img.copy(), 'frame': frame.copy(),
-                                     'location': (top, right, bottom, left)}
+                session.stats['unknown_faces'] += 1
+                if quality is not None:
+                    # None: the face was not checked on this frame, or failed the check
+                    keep_unknown_face(session, frame, (top, right, bottom, left), encoding, quality, now)
                 recognized_faces.append({"name": "Unknown", "status": "unknown", "box": [left, top, right, bottom]})
-        return {"faces": recognized_faces, "unknown_detected": unknown_detected, "attendance_count": len(attendance)}
+        for (top, right, bottom, left), reason in rejected:
+            session.stats['rejected_faces'] += 1
+            quality_gate.count_rejected(reason)
+            recognized_faces.append({"name": "Unknown", "status": "low_quality", "reason": reason,
+                                     "box": [left, top, right, bottom]})
+        attendance_count = len(session.attendance)
+        unknown_count = sum(1 for face in recognized_faces if face['status'] == 'unknown')
+        if unknown_count:
+            # Coalesced: a client that falls behind only gets the latest of these
+            broadcaster.publish(session_topic(session.key), {
+                'type': 'unknown', 'faces': unknown_count, 'time': time.strftime('%H:%M:%S'),
+            }, key='unknown')
+    if template_candidates:
+        # Outside the session lock: gallery updates take state_lock first
+        add_live_templates(template_candidates)
+    return {"faces": recognized_faces, "unknown_detected": unknown_detected, "attendance_count": attendance_count}
+
+
+def match_faces(face_encodings):
+    if recognition_cache is not None:
+        return recognition_cache.match(known_faces, face_encodings, MATCH_TOLERANCE)
+    return known_faces.match(face_encodings, MATCH_TOLERANCE)
+
+
+def recognize_frame(frame, session):
+    with metrics.stage('detect'):
+        face_locations = detect_faces(frame, **DETECTION_OPTIONS)
+    tracker = session.tracker
+    if tracker is None:
+        with metrics.stage('quality'):
+            qualities = quality_gate.assess(frame, face_locations)
+        accepted = [(location, score) for location, (score, reason) in zip(face_locations, qualities)
+                    if reason is None]
+        rejected = [(location, reason) for location, (_, reason) in zip(face_locations, qualities)
+                    if reason is not None]
+        with metrics.stage('encode'):
+            face_encodings = encode_faces(frame, [location for location, _ in accepted])
+        with metrics.stage('match'):
+            matches = match_faces(face_encodings)
+        faces = [(location, roll, distance, encoding, score)
+                 for (location, score), encoding, (roll, distance) in zip(accepted, face_encodings, matches)]
+        return apply_recognition(session, frame, faces, rejected)
+
+    with tracker.lock:
+        now = time.monotonic()
+        version = known_faces.version
+        with metrics.stage('track'):
+            tracks = tracker.associate(face_locations, now)
+            stale = [track for track in tracks if tracker.needs_encoding(track, now, version)]
+        # Unknown faces are checked every frame too, since their crop may be kept for registration
+        assessed = [track for track in tracks if track in stale or track.roll is None]
+        with metrics.stage('quality'):
+            qualities = quality_gate.assess(frame, [track.location for track in assessed])
+        scores = {track.id: score for track, (score, reason) in zip(assessed, qualities) if reason is None}
+        reasons = {track.id: reason for track, (_, reason) in zip(assessed, qualities) if reason is not None}
+        # A rejected face keeps the identity from its last good encoding and is retried next frame
+        accepted = [track for track in stale if track.id in scores]
+        if accepted:
+            with metrics.stage('encode'):
+                face_encodings = encode_faces(frame, [track.location for track in accepted])
+            with metrics.stage('match'):
+                matches = match_faces(face_encodings)
+            for track, encoding, (roll, distance) in zip(accepted, face_encodings, matches):
+                tracker.identify(track, encoding, roll, distance, now, version)
+        faces = [(track.location, track.roll, track.distance, track.encoding, scores.get(track.id))
+                 for track in tracks if track.encoded_at is not None]
+        rejected = [(track.location, reasons[track.id]) for track in tracks if track.encoded_at is None]
+    return apply_recognition(session, frame, faces, rejected)
+
+
+def recognize_with_pool(image_bytes, session):
+    with metrics.stage('pool'):
+        results = inference_pool.submit(image_bytes).result()
+    if results is None:
+        raise ValueError("Could not decode image")
+    faces = []
+    rejected = []
+    for location, encoding, row, distance, score, reason in results:
+        if reason is not None:
+            rejected.append((location, reason))
+            continue
+        roll = known_faces.ids[row] if row >= 0 and distance <= MATCH_TOLERANCE else None
+        faces.append((location, roll, distance, encoding, score))
+    # Workers only send boxes back; decode here when an unknown crop must be kept
+    frame = decode_frame_bytes(image_bytes) if any(face[1] is None for face in faces) else None
+    return apply_recognition(session, frame, faces, rejected)
+
+
+def gate_frame(image_bytes, session, recognize):
+    """Return the session's cached result if this frame matches its previous one, else recognize()."""
+    if FRAME_HASH_DISTANCE < 0 or session.key == DEFAULT_SESSION:
+        return recognize()
+    with metrics.stage('hash'):
+        frame_hash = dhash(image_bytes)
+    # A cleared session or a new registration makes earlier results stale
+    state = (session.attendance_session, known_faces.version)
+    cached = frame_gate.lookup(session.key, frame_hash, state)
+    if cached is not None:
+        with session.lock:
+            session.stats['cached_frames'] += 1
+            attendance_count = len(session.attendance)
+        return dict(cached, attendance_count=attendance_count, cached=True)
+    result = recognize()
+    frame_gate.store(session.key, frame_hash, state, result)
+    return result
+
+
+def process_frame(frame_data, session_id=None):
+    try:
+        session = sessions.get(session_id)
+        with metrics.frame(session_id), profiler.maybe_profile():
+            with metrics.stage('base64'):
+                image_bytes = frame_data_to_bytes(frame_data)
+            if inference_pool is not None:
+                return gate_frame(image_bytes, session, lambda: recognize_with_pool(image_bytes, session))
+            return gate_frame(image_bytes, session,
+                              lambda: recognize_frame(decode_image_bytes(image_bytes), session))
     except Exception as e:
         print(f"Error processing frame: {str(e)}")
         return {"error": str(e)}
 
 
-def add_new_student(face_img, roll, name):
-    global known_face_encodings, known_face_ids, roll_to_name, attendance
-    if roll in known_face_ids:
-        return False, "Roll number already exists"
+def process_frame_bytes(image_bytes, session_id=None):
     try:
-        # Save image
-        image_path = os.path.join(IMAGES_DIR, f"{roll}.png")
-        cv2.imwrite(image_path, face_img)
+        session = sessions.get(session_id)
+        with metrics.frame(session_id), profiler.maybe_profile():
+            if inference_pool is not None:
+                return gate_frame(image_bytes, session, lambda: recognize_with_pool(image_bytes, session))
+            return gate_frame(image_bytes, session,
+                              lambda: recognize_frame(decode_frame_bytes(image_bytes), session))
+    except Exception as e:
+        print(f"Error processing frame: {str(e)}")
+        return {"error": str(e)}
 
-        # Update CSV
-        with open(csv_file, 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([roll, name])
 
-        roll_to_name[roll] = name
+def process_stream_frame(frame, session_id):
+    # Errors propagate so the stream can count them
+    session = sessions.get(session_id)
+    with metrics.frame(session_id), profiler.maybe_profile():
+        if inference_pool is not None:
+            with metrics.stage('imencode'):
+                image_bytes = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+            return recognize_with_pool(image_bytes, session)
+        return recognize_frame(frame, session)
+
+
+def register_unknown_face(session_id, roll, name):
+    """Enrol the unknown face last seen by a camera session."""
+    # Only the unknown face last seen by this camera can be registered from it
+    session = sessions.peek(session_id)
+    unknown_face = session.last_unknown_face if session is not None else None
+    if unknown_face is None:
+        return False, "No unknown face available"
+    success, message = add_new_student(unknown_face['face_img'], roll, name,
+                                       unknown_face['location'], unknown_face['encoding'], session)
+    if success:
+        with session.lock:
+            if session.last_unknown_face is unknown_face:
+                session.last_unknown_face = None
+    return success, message
 
-        # Update face encodings
-        image = face_recognition.load_image_file(image_path)
-        encodings = face_recognition.face_encodings(image)
-        if not encodings:
-            return False, "Failed to encode face"
-        known_face_encodings.append(encodings[0])
-        known_face_ids.append(roll)
-        save_known_faces()
-        attendance.add(roll)
+
+def add_new_student(face_img, roll, name, location=None, encoding=None, session=None):
+    with state_lock:
+        return _add_new_student(face_img, roll, name, location, encoding, session)
+
+
+def _add_new_student(face_img, roll, name, location=None, encoding=None, session=None):
+    global roll_to_name
+    if not valid_roll(roll):
+        return False, "Invalid roll number"
+    # A roll listed in students.csv without a photo can still be given a face
+    if roll in known_faces:
+        return False, "Roll number already exists"
+    try:
+        if encoding is None:
+            # Encode at the box found when the face was seen; only search the image without one
+            locations = [location] if location is not None else detect_faces(face_img)
+            encodings = encode_faces(face_img, locations)
+            if not encodings:
+                return False, "Failed to encode face"
+            encoding = encodings[0]
+
+        db.add_student(roll, name)
+        roll_to_name[roll] = name
+        known_faces.add(encoding, roll)
+        face_store.append(encoding, roll)
+        save_retrained_index()
+        if inference_pool is not None:
+            inference_pool.publish(known_faces)
+        # Written in the background; if it never lands, the startup sync keeps the student anyway
+        image_writer.save(os.path.join(IMAGES_DIR, f"{roll}.png"), face_img)
+        if session is not None:
+            with session.lock:
+                broadcaster.publish(session_topic(session.key), {'type': 'registered', 'roll': roll, 'name': name})
+                mark_present(session, roll)
+                session.stats['registered'] += 1
         return True, "Student added successfully"
     except Exception as e:
         return False, f"Error: {str(e)}"
@@ -295,6 +809,24 @@ def index():
                 let cameraStream = null;
                 let processingInterval = null;
                 let unknownFaceDetected = false;
+                // Identifies this camera to the server so faces can be tracked between frames
+                // Kept for the tab's lifetime, so reloading the page keeps the same attendance session
+                const sessionId = sessionStorage.getItem('sessionId') ||
+                    ((window.crypto && crypto.randomUUID) ? crypto.randomUUID() : String(Date.now() + Math.random()));
+                sessionStorage.setItem('sessionId', sessionId);
+                // Shown on faces the server skipped as too small, blurred or turned away
+                const qualityHints = {size: 'Move closer', blur: 'Hold still', pose: 'Face the camera'};
+
+                // Motion gating: frames are only uploaded when a small grey thumbnail changes
+                const motionThreshold = {{ motion_threshold }};
+                const motionMaxSkipMs = {{ motion_max_skip }} * 1000;
+                const motionCanvas = document.createElement('canvas');
+                motionCanvas.width = 32;
+                motionCanvas.height = 24;
+                const motionCtx = motionCanvas.getContext('2d', { willReadFrequently: true });
+                let lastMotionFrame = null;
+                let lastUploadTime = 0;
+                let skippedFrames = 0;
 
                 // Buttons
                 const startBtn = document.getElementById('startBtn');
@@ -375,6 +907,7 @@ def index():
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
+                            'X-Session-Id': sessionId,
                         },
                         body: JSON.stringify({ roll: roll, name: name }),
                     })
@@ -407,7 +940,7 @@ def index():
                 // Clear attendance
                 clearBtn.addEventListener('click', () => {
                     if (confirm('Are you sure you want to clear the attendance?')) {
-                        fetch('/clear_attendance', { method: 'POST' })
+                        fetch('/clear_attendance', { method: 'POST', headers: { 'X-Session-Id': sessionId } })
                             .then(response => response.json())
                             .then(data => {
                                 alert(data.message);
@@ -429,39 +962,71 @@ def index():
                     }
                 });
 
+                // Compare a thumbnail of the current frame with the last uploaded one
+                function sceneChanged() {
+                    if (motionThreshold <= 0) return true;
+                    motionCtx.drawImage(video, 0, 0, motionCanvas.width, motionCanvas.height);
+                    const pixels = motionCtx.getImageData(0, 0, motionCanvas.width, motionCanvas.height).data;
+                    const gray = new Uint8Array(motionCanvas.width * motionCanvas.height);
+                    for (let i = 0, j = 0; j < gray.length; i += 4, j++) {
+                        gray[j] = (pixels[i] * 77 + pixels[i + 1] * 150 + pixels[i + 2] * 29) >> 8;
+                    }
+                    if (lastMotionFrame && Date.now() - lastUploadTime < motionMaxSkipMs) {
+                        let diff = 0;
+                        for (let j = 0; j < gray.length; j++) {
+                            diff += Math.abs(gray[j] - lastMotionFrame[j]);
+                        }
+                        if (diff / gray.length < motionThreshold) return false;
+                    }
+                    lastMotionFrame = gray;
+                    return true;
+                }
+
                 // Process video frame and send to server
                 function processVideoFrame() {
                     if (!cameraStream) return;
+                    if (!sceneChanged()) {
+                        skippedFrames++;
+                        return;
+                    }
+                    lastUploadTime = Date.now();
+                    const skipped = skippedFrames;
+                    skippedFrames = 0;
 
                     // Draw video frame to canvas
                     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-                    // Convert canvas to base64
-                    const imageData = canvas.toDataURL('image/jpeg', 0.8);
+                    // Encode canvas as JPEG and send the raw bytes for processing
+                    canvas.toBlob(blob => {
+                        if (!blob) return;
+                        fetch('/process_frame_raw', {
+                            method: 'POST',
+                            headers: {
+                                'Content-Type': 'application/octet-stream',
+                                'X-Session-Id': sessionId,
+                                'X-Frames-Skipped': String(skipped),
+                            },
+                            body: blob,
+                        })
+                        .then(response => response.json())
+                        .then(handleFrameResult);
+                    }, 'image/jpeg', 0.8);
+                }
 
-                    // Send to server for processing
-                    fetch('/process_frame', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({ image: imageData }),
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.error) {
-                            console.error('Error processing frame:', data.error);
-                            return;
-                        }
+                // Update UI with the server's recognition result
+                function handleFrameResult(data) {
+                    if (data.error) {
+                        console.error('Error processing frame:', data.error);
+                        return;
+                    }
 
-                        // Update UI with recognition results
-                        updateFaceBoxes(data.faces);
-                        document.getElementById('attendanceCount').textContent = `Students present: ${data.attendance_count}`;
+                    // Update UI with recognition results
+                    updateFaceBoxes(data.faces);
+                    document.getElementById('attendanceCount').textContent = `Students present: ${data.attendance_count}`;
 
-                        // Enable/disable register button
-                        unknownFaceDetected = data.unknown_detected;
-                        registerBtn.disabled = !unknownFaceDetected;
-                    });
+                    // Enable/disable register button
+                    unknownFaceDetected = data.unknown_detected;
+                    registerBtn.disabled = !unknownFaceDetected;
                 }
 
                 // Update face boxes on video
@@ -491,14 +1056,16 @@ def index():
                         boxElement.style.top = `${top * scaleY}px`;
                         boxElement.style.width = `${boxWidth * scaleX}px`;
                         boxElement.style.height = `${boxHeight * scaleY}px`;
-                        boxElement.style.borderColor = face.status === 'known' ? '#4CAF50' : '#f44336';
+                        boxElement.style.borderColor = face.status === 'known' ? '#4CAF50'
+                            : face.status === 'low_quality' ? '#9e9e9e' : '#f44336';
 
                         // Create label element
                         const labelElement = document.createElement('div');
                         labelElement.className = 'face-label';
                         labelElement.style.left = `${left * scaleX}px`;
                         labelElement.style.top = `${(top * scaleY) - 20}px`;
-                        labelElement.textContent = face.status === 'known' ? face.name : 'Unknown';
+                        labelElement.textContent = face.status === 'known' ? face.name
+                            : face.status === 'low_quality' ? (qualityHints[face.reason] || 'Unknown') : 'Unknown';
 
                         container.appendChild(boxElement);
                         container.appendChild(labelElement);
@@ -535,7 +1102,7 @@ def index():
 
                 // Fetch attendance data
                 function fetchAttendance() {
-                    fetch('/attendance_data')
+                    fetch('/attendance_data', { headers: { 'X-Session-Id': sessionId } })
                         .then(response => response.json())
                         .then(data => {
                             const tableBody = document.getElementById('attendanceBody');
@@ -566,7 +1133,8 @@ def index():
         </body>
         </html>
         """
-    return render_template_string(html)
+    return render_template_string(html, motion_threshold=MOTION_THRESHOLD,
+                                  motion_max_skip=MOTION_MAX_SKIP_SECONDS)
 
 
 @app.route('/process_frame', methods=['POST'])
@@ -574,53 +1142,349 @@ def process_frame_endpoint():
     data = request.json
     if not data or 'image' not in data:
         return jsonify({"error": "No image data received"}), 400
-    result = process_frame(data['image'])
+    frame_gate.count_client_skips(request.headers.get('X-Frames-Skipped'))
+    result = process_frame(data['image'], data.get('session') or request.headers.get('X-Session-Id'))
+    return jsonify(result)
+
+
+@app.route('/process_frame_raw', methods=['POST'])
+def process_frame_raw_endpoint():
+    # Accepts the JPEG as the raw request body or as an "image" multipart file
+    if 'image' in request.files:
+        image_bytes = request.files['image'].read()
+    else:
+        image_bytes = request.get_data(cache=False)
+    if not image_bytes:
+        return jsonify({"error": "No image data received"}), 400
+    frame_gate.count_client_skips(request.headers.get('X-Frames-Skipped'))
+    result = process_frame_bytes(image_bytes, request.headers.get('X-Session-Id'))
     return jsonify(result)
 
 
 @app.route('/register_student', methods=['POST'])
 def register_student():
-    global last_unknown_face
     data = request.json
     if not data or 'roll' not in data or 'name' not in data:
         return jsonify({"status": "error", "message": "Missing required data"})
-    if last_unknown_face is None:
-        return jsonify({"status": "error", "message": "No unknown face available"})
-    roll = data['roll']
-    name = data['name']
-    success, message = add_new_student(last_unknown_face['face_img'], roll, name)
+    success, message = register_unknown_face(data.get('session') or request.headers.get('X-Session-Id'),
+                                             data['roll'], data['name'])
     if success:
-        last_unknown_face = None
         return jsonify({"status": "success", "message": message})
     else:
         return jsonify({"status": "error", "message": message})
 
 
+@app.route('/enrol_bulk', methods=['POST'])
+def enrol_bulk():
+    # Multipart upload: "photos" is a zip of <roll>.jpg files, "roster" a roll,name[,photo] CSV
+    if 'photos' not in request.files or 'roster' not in request.files:
+        return jsonify({"status": "error", "message": "Missing required data"}), 400
+    try:
+        roster = read_roster(io.TextIOWrapper(request.files['roster'].stream, encoding='utf-8-sig'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as upload:
+        request.files['photos'].save(upload)
+    try:
+        photos = list_photos(upload.name) if zipfile.is_zipfile(upload.name) else {}
+        if not photos:
+            return jsonify({"status": "error", "message": "Photos must be a zip of images"}), 400
+        # Encoding runs without the lock; only the final commit blocks frames
+        accepted, skipped = encode_roster(roster, photos, known_faces, REBUILD_WORKERS)
+        with state_lock:
+            enrolled = enrol_students(accepted, photos)
+    finally:
+        os.remove(upload.name)
+    skipped.extend({'roll': roll, 'reason': 'already_enrolled'}
+                   for roll, _, _, _ in accepted if roll not in enrolled)
+    return jsonify({"status": "success", "enrolled": enrolled, "skipped": skipped,
+                    "message": f"Enrolled {len(enrolled)} of {len(roster)} students"})
+
+
+def enrol_students(accepted, photos):
+    """Add encoded students to the gallery, store and database in one batch."""
+    global roll_to_name
+    # Anyone registered from the camera while the batch was encoding keeps that registration
+    accepted = [entry for entry in accepted if entry[0] not in known_faces]
+    if not accepted:
+        return []
+    rolls = [roll for roll, _, _, _ in accepted]
+    encodings = [encoding for _, _, encoding, _ in accepted]
+    save_photos(accepted, photos, IMAGES_DIR)
+    db.import_students((roll, name) for roll, name, _, _ in accepted)
+    roll_to_name = db.roll_to_name()
+    known_faces.extend(encodings, rolls)
+    face_store.extend(encodings, rolls)
+    save_retrained_index()
+    if inference_pool is not None:
+        inference_pool.publish(known_faces)
+    return rolls
+
+
 @app.route('/attendance_data')
 def get_attendance_data():
+    session = sessions.peek(request.args.get('session') or request.headers.get('X-Session-Id'))
+    if session is None:
+        return jsonify({'attendance': []})
+    with session.lock:
+        present = sorted(session.attendance)
     students_present = [
         {'roll': roll, 'name': roll_to_name.get(roll, 'Unknown')}
-        for roll in sorted(attendance)
+        for roll in present
     ]
     return jsonify({'attendance': students_present})
 
 
+def report_filters(args):
+    return {
+        'class_name': args.get('class') or None,
+        'roll': args.get('roll') or None,
+        'start': parse_time(args.get('from')),
+        'end': parse_time(args.get('to'), end=True),
+    }
+
+
+@app.route('/attendance/records')
+def attendance_records():
+    try:
+        filters = report_filters(request.args)
+        after = decode_cursor(request.args.get('cursor'))
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Include events still waiting in the journal's write-behind buffer
+    attendance_journal.flush()
+    rows = db.attendance_page(after=after, limit=limit, **filters)
+    return jsonify({
+        'records': [format_record(row) for row in rows],
+        'next_cursor': encode_cursor(rows[-1]) if len(rows) == limit else None,
+    })
+
+
+@app.route('/attendance/export')
+def attendance_export():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'error': "format must be csv or jsonl"}), 400
+    try:
+        filters = report_filters(request.args)
+        after = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    attendance_journal.flush()
+    # Streamed page by page, so memory stays flat however many records match
+    pages = iter_pages(db, filters, after)
+    body = csv_chunks(pages) if export_format == 'csv' else jsonl_chunks(pages)
+    filename = f"attendance-{time.strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(body, mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/gallery/audit')
+def gallery_audit():
+    try:
+        limit = max(int(request.args.get('limit', 100)), 0)
+        duplicate_distance = float(request.args.get('duplicate_distance', DUPLICATE_DISTANCE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not audit_lock.acquire(blocking=False):
+        return jsonify({'error': "An audit is already running"}), 409
+    try:
+        # Copy under the lock, then compare without holding up registrations
+        with state_lock:
+            encodings = known_faces.encodings.copy()
+            ids = list(known_faces.ids)
+        report = audit_gallery(encodings, ids, MATCH_TOLERANCE, duplicate_distance, limit=limit)
+    finally:
+        audit_lock.release()
+    return jsonify(report)
+
+
 @app.route('/clear_attendance', methods=['POST'])
 def clear_attendance():
-    global attendance
-    attendance = set()
-    save_attendance()
+    data = request.get_json(silent=True) or {}
+    session = sessions.get(data.get('session') or request.headers.get('X-Session-Id'))
+    with session.lock:
+        # Snapshot the session being closed, then start a new one
+        save_attendance(session)
+        now = time.time()
+        attendance_journal.record_clear(session.attendance_session, now)
+        session.attendance = {}
+        session.attendance_session = new_session_id()
+        session.class_name = data.get('class') or session.class_name
+        attendance_journal.record_start(session.attendance_session, session.class_name, now, session.key)
+        broadcaster.publish(session_topic(session.key), {
+            'type': 'cleared', 'attendance_session': session.attendance_session, 'class': session.class_name,
+        })
+    attendance_journal.flush()
     return jsonify({'status': 'success', 'message': 'Attendance cleared successfully'})
 
 
+@app.route('/ready')
+def ready_endpoint():
+    # 503 until the face models are loaded, so load balancers hold traffic until then
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
+
+@app.route('/sessions')
+def sessions_endpoint():
+    return jsonify({'sessions': [session.describe() for session in sessions.sessions()]})
+
+
+@app.route('/sessions/<path:key>/events')
+def session_events(key):
+    # Server-sent events as attendance changes, starting with the current list
+    return Response(broadcaster.stream(session_topic(key), snapshot=lambda: attendance_snapshot(key)),
+                    mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/streams', methods=['GET', 'POST'])
+def streams_endpoint():
+    if request.method == 'GET':
+        return jsonify({'streams': streams.describe()})
+    data = request.get_json(silent=True) or {}
+    if not data.get('name') or not data.get('source'):
+        return jsonify({"status": "error", "message": "Missing required data"}), 400
+    # The source goes straight to cv2.VideoCapture, which opens any file, device or URL
+    source = str(data['source'])
+    if source not in STREAM_SOURCES.values() and not source_allowed(source, STREAM_ALLOWED_SOURCES):
+        return jsonify({"status": "error", "message": "Stream source not allowed"}), 403
+    try:
+        streams.start(str(data['name']), source)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    return jsonify({"status": "success", "message": f"Stream {data['name']} started"})
+
+
+@app.route('/streams/<name>', methods=['DELETE'])
+def stop_stream(name):
+    if not streams.stop(name):
+        return jsonify({"status": "error", "message": "No such stream"}), 404
+    return jsonify({"status": "success", "message": f"Stream {name} stopped"})
+
+
+@app.route('/streams/<name>/events')
+def stream_events(name):
+    # Server-sent events with the recognition result of every processed frame
+    return Response(broadcaster.stream(f"stream:{name}"), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/debug/profile', methods=['GET', 'POST'])
+def profile_endpoint():
+    if not PROFILER_ENABLED:
+        return jsonify({"status": "error", "message": "Profiler is disabled"}), 404
+    if request.method == 'GET':
+        return jsonify(profiler.last_report or {})
+    data = request.get_json(silent=True) or {}
+    frames = int(data.get('frames', 20))
+    profiler.arm(frames)
+    return jsonify({"status": "success", "message": f"Profiling the next {frames} frames"})
+
+
+@app.before_request
+def ensure_started():
+    # Servers pointed at `demo:app` rather than the factory still get a started app
+    if not started:
+        create_app()
+
+
+def create_app():
+    """Start the app on first call and return the Flask app; later calls just return it.
+
+    Run it as `gunicorn 'demo:create_app()'` or `flask --app 'demo:create_app()' run`.
+    """
+    global started
+    with startup_lock:
+        if not started:
+            initialize_app()
+            started = True
+    return app
+
+
+def warm_up():
+    start = time.perf_counter()
+    try:
+        load_models()
+    except Exception as e:
+        readiness['error'] = str(e)
+        print(f"Error loading face models: {str(e)}")
+        return
+    readiness['models_seconds'] = round(time.perf_counter() - start, 3)
+    readiness['ready'] = True
+    print(f"Face models loaded in {readiness['models_seconds']:.2f}s.")
+
+
+def close_app():
+    # Registrations changed the store since startup; once their images are on disk, the two match again
+    image_writer.stop()
+    with state_lock:
+        if gallery_synced and face_store.exists():
+            gallery_snapshot.save()
+        save_matcher_index()
+
+
 def initialize_app():
+    start = time.perf_counter()
     ensure_directories()
+    image_writer.start()
+    init_database()
     load_roll_to_name()
     load_known_faces()
-    print("Face recognition system initialized successfully!")
-
+    load_attendance()
+    # Forked inference workers inherit models loaded here instead of each loading their own
+    if PRELOAD_MODELS or INFERENCE_WORKERS > 0:
+        warm_up()
+    start_inference_pool()
+    start_streams()
+    atexit.register(close_app)
+    metrics.gauges['face_inference_queue_depth'] = (
+        lambda: inference_pool.queue_depth if inference_pool is not None else 0)
+    metrics.gauges['face_attendance_present'] = (
+        lambda: sum(len(session.attendance) for session in sessions.sessions()))
+    metrics.gauges['face_sessions_active'] = lambda: len(sessions)
+    metrics.gauges['face_event_subscribers'] = broadcaster.subscriber_count
+    if recognition_cache is not None:
+        metrics.gauges['face_recognition_cache_hits'] = lambda: recognition_cache.hits
+        metrics.gauges['face_recognition_cache_misses'] = lambda: recognition_cache.misses
+        metrics.gauges['face_recognition_cache_entries'] = lambda: len(recognition_cache)
+    metrics.gauges['face_frames_skipped_client'] = lambda: frame_gate.client_skipped
+    for reason in quality_gate.rejected:
+        metrics.gauges[f'face_quality_rejected_{reason}'] = lambda reason=reason: quality_gate.rejected[reason]
+    metrics.gauges['face_frames_cached_server'] = lambda: frame_gate.hits
+    metrics.gauges['face_stream_frames_skipped'] = (
+        lambda: sum(stream['skipped'] for stream in streams.describe()))
+    readiness['startup_seconds'] = round(time.perf_counter() - start, 3)
+    if not readiness['ready']:
+        threading.Thread(target=warm_up, name="model-warm-up", daemon=True).start()
+    print(f"Face recognition system initialized in {readiness['startup_seconds']:.2f}s!")
+
+
+def start_inference_pool():
+    global inference_pool
+    if INFERENCE_WORKERS <= 0:
+        return
+    inference_pool = InferencePool(INFERENCE_WORKERS, max_batch=INFERENCE_MAX_BATCH,
+                                   max_wait=INFERENCE_MAX_WAIT_MS / 1000.0,
+                                   detection_options=DETECTION_OPTIONS, quality_gate=quality_gate)
+    inference_pool.start(known_faces)
+
+
+def start_streams():
+    global streams
+    streams = StreamManager(process_stream_frame,
+                            lambda name, result: broadcaster.publish(f"stream:{name}", result),
+                            buffer_size=STREAM_BUFFER_SIZE,
+                            min_interval=1.0 / STREAM_MAX_FPS if STREAM_MAX_FPS > 0 else 0.0)
+    for name, source in STREAM_SOURCES.items():
+        streams.start(name, source)
+        print(f"Started stream {name} from {source}")
 
-initialize_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+
+
+def parse_roi(value):
+    """Parse "left,top,right,bottom" fractions of the frame, e.g. "0,0.2,1,1"."""
+    if not value:
+        return None
+    left, top, right, bottom = (float(part) for part in value.split(','))
+    if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+        raise ValueError(f"Invalid detection ROI: {value}")
+    return left, top, right, bottom
+
+
+def detect_faces(frame, scale=1.0, roi=None, min_face_size=0, upsample=1):
+    """Run HOG detection on a downscaled copy of the frame.
+
+    Boxes are returned as (top, right, bottom, left) in full-resolution pixel
+    coordinates, so face_encodings can still run on the original frame.
+    """
+    height, width = frame.shape[:2]
+    offset_x = offset_y = 0
+    region = frame
+    if roi is not None:
+        offset_x, offset_y = int(roi[0] * width), int(roi[1] * height)
+        region = frame[offset_y:int(roi[3] * height), offset_x:int(roi[2] * width)]
+    if scale != 1.0:
+        region = cv2.resize(region, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    import face_recognition
+    face_locations = []
+    for top, right, bottom, left in face_recognition.face_locations(region, number_of_times_to_upsample=upsample):
+        top = min(max(int(round(top / scale)) + offset_y, 0), height)
+        bottom = min(max(int(round(bottom / scale)) + offset_y, 0), height)
+        left = min(max(int(round(left / scale)) + offset_x, 0), width)
+        right = min(max(int(round(right / scale)) + offset_x, 0), width)
+        if min(bottom - top, right - left) < min_face_size:
+            continue
+        face_locations.append((top, right, bottom, left))
+    return face_locations
+
+
+def encode_faces(frame, face_locations):
+    """face_encodings for faces in a BGR frame; dlib's model expects RGB input."""
+    if not face_locations:
+        return []
+    import face_recognition
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return face_recognition.face_encodings(rgb, face_locations)
+
+
+def load_models():
+    """Import face_recognition, which loads dlib's models, and run each model once.
+
+    detect_faces and encode_faces import it on first use; calling this ahead
+    of time moves that cost out of the first request, and before a fork it
+    lets every worker share the loaded models.
+    """
+    import face_recognition
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, [(8, 56, 56, 8)])
+
+
+def face_yaw(frame, face_locations):
+    """How far each face is turned left or right, from dlib's 5-point landmarks.
+
+    Compares the horizontal distance from the nose tip to each eye: 0 for a
+    frontal face, approaching -1 or 1 as the nose reaches one eye in profile.
+    Far cheaper than an encoding, which also runs the 68-point model.
+    """
+    if not face_locations:
+        return []
+    import face_recognition
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    yaws = []
+    for landmarks in face_recognition.face_landmarks(rgb, face_locations, model='small'):
+        nose = landmarks['nose_tip'][0][0]
+        to_left = abs(nose - np.mean([x for x, _ in landmarks['left_eye']]))
+        to_right = abs(np.mean([x for x, _ in landmarks['right_eye']]) - nose)
+        total = to_left + to_right
+        yaws.append(float((to_left - to_right) / total) if total else 1.0)
+    return yaws
@@ -0,0 +1,172 @@
+import argparse
+import os
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, FaceGallery, load_gallery_file
+
+_RECORD_BYTES = ENCODING_SIZE * 4
+
+
+class EmbeddingStore:
+    """Append-only embedding file plus ID index, opened with np.memmap.
+
+    <prefix>.f32 holds one float32 row of 128 values per record and
+    <prefix>_ids.txt the matching id, one per line. Deleting a student only
+    appends the row number to <prefix>_deleted.txt; compact() rewrites the
+    files without those rows.
+    """
+
+    def __init__(self, prefix):
+        self.matrix_path = prefix + ".f32"
+        self.ids_path = prefix + "_ids.txt"
+        self.deleted_path = prefix + "_deleted.txt"
+
+    def exists(self):
+        return os.path.exists(self.matrix_path) and os.path.exists(self.ids_path)
+
+    def _read_ids(self):
+        with open(self.ids_path, 'r', encoding='utf-8') as file:
+            return [line.rstrip('\n') for line in file]
+
+    def _read_deleted(self):
+        if not os.path.exists(self.deleted_path):
+            return set()
+        with open(self.deleted_path, 'r') as file:
+            return {int(line) for line in file if line.strip()}
+
+    def _recover(self):
+        """Drop a half-written last record left behind by a crash mid-append."""
+        ids = self._read_ids()
+        rows = os.path.getsize(self.matrix_path) // _RECORD_BYTES
+        count = min(rows, len(ids))
+        if os.path.getsize(self.matrix_path) != count * _RECORD_BYTES:
+            with open(self.matrix_path, 'r+b') as file:
+                file.truncate(count * _RECORD_BYTES)
+        if len(ids) != count:
+            self._write_ids(self.ids_path, ids[:count])
+        return ids[:count]
+
+    @staticmethod
+    def _write_ids(path, ids):
+        with open(path, 'w', encoding='utf-8', newline='\n') as file:
+            for face_id in ids:
+                file.write(f"{face_id}\n")
+
+    def load(self):
+        ids = self._recover()
+        if not ids:
+            return FaceGallery()
+        matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(len(ids), ENCODING_SIZE))
+        deleted = self._read_deleted()
+        if not deleted:
+            # Matching reads straight from the mapped file until the first append
+            return FaceGallery.from_matrix(matrix, ids)
+        keep = np.array([row for row in range(len(ids)) if row not in deleted], dtype=np.int64)
+        print(f"{len(deleted)} deleted encodings in store; run compaction to reclaim them.")
+        return FaceGallery(matrix[keep], [ids[row] for row in keep.tolist()])
+
+    def append(self, encoding, face_id):
+        self.extend([encoding], [face_id])
+
+    def extend(self, encodings, ids):
+        """Append several records with one write and one fsync per file."""
+        ids = [str(face_id) for face_id in ids]
+        if any('\n' in face_id or '\r' in face_id for face_id in ids):
+            raise ValueError("Id must not contain line breaks")
+        records = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if records.shape[0] != len(ids):
+            raise ValueError("Number of ids does not match number of encodings")
+        # Embeddings first, then ids: a crash in between leaves rows _recover drops
+        with open(self.matrix_path, 'ab') as file:
+            file.write(records.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        with open(self.ids_path, 'a', encoding='utf-8', newline='\n') as file:
+            file.write(''.join(f"{face_id}\n" for face_id in ids))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def delete(self, face_id):
+        rows = [row for row, stored_id in enumerate(self._read_ids()) if stored_id == face_id]
+        with open(self.deleted_path, 'a') as file:
+            for row in rows:
+                file.write(f"{row}\n")
+        return len(rows)
+
+    def write(self, known_faces):
+        """Replace the store with the contents of a FaceGallery."""
+        matrix_tmp = self.matrix_path + ".tmp"
+        ids_tmp = self.ids_path + ".tmp"
+        with open(matrix_tmp, 'wb') as file:
+            file.write(np.ascontiguousarray(known_faces.encodings, dtype=np.float32).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        self._write_ids(ids_tmp, known_faces.ids)
+        os.replace(matrix_tmp, self.matrix_path)
+        os.replace(ids_tmp, self.ids_path)
+        if os.path.exists(self.deleted_path):
+            os.remove(self.deleted_path)
+
+    def compact(self):
+        known_faces = self.load()
+        # Copy out of the memmap before the files underneath it are replaced
+        self.write(FaceGallery(np.array(known_faces.encodings), list(known_faces.ids)))
+        return len(known_faces)
+
+    def migrate_pickle(self, pickle_path):
+        known_faces = load_gallery_file(pickle_path)
+        self.write(known_faces)
+        return len(known_faces)
+
+
+def move_images_aside(data_dir, face_id):
+    """Move a student's reference images to data/deleted_images and drop them from the manifest.
+
+    Otherwise the startup sync finds the images again and re-encodes the
+    student. Returns the number of images moved.
+    """
+    from rebuild import identity_of, load_manifest, save_manifest, scan_images
+    images_dir = os.path.join(data_dir, "images")
+    deleted_dir = os.path.join(data_dir, "deleted_images")
+    filenames = [filename for filename in scan_images(images_dir) if identity_of(filename) == face_id]
+    for filename in filenames:
+        target = os.path.join(deleted_dir, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(os.path.join(images_dir, filename), target)
+    template_dir = os.path.join(images_dir, face_id)
+    if os.path.isdir(template_dir) and not os.listdir(template_dir):
+        os.rmdir(template_dir)
+
+    manifest_path = os.path.join(data_dir, "face_manifest.json")
+    manifest = load_manifest(manifest_path)
+    if manifest:
+        kept = {filename: entry for filename, entry in manifest.items() if identity_of(filename) != face_id}
+        if len(kept) != len(manifest):
+            save_manifest(manifest_path, kept)
+    return len(filenames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the face embedding store")
+    parser.add_argument("command", choices=["compact", "migrate", "delete"])
+    parser.add_argument("ids", nargs="*", help="ids to delete")
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(os.path.join(args.data_dir, "face_encodings"))
+    if args.command == "migrate":
+        count = store.migrate_pickle(os.path.join(args.data_dir, "face_encodings.pkl"))
+        print(f"Migrated {count} encodings to {store.matrix_path}.")
+    elif args.command == "compact":
+        count = store.compact()
+        print(f"Compacted store to {count} encodings.")
+    else:
+        for face_id in args.ids:
+            count = store.delete(face_id)
+            moved = move_images_aside(args.data_dir, face_id)
+            print(f"Deleted {count} encodings for {face_id}, moved {moved} images to deleted_images.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from gallery import FaceGallery
+from embedding_store import EmbeddingStore
+from rebuild import IMAGE_EXTENSIONS
+
+DUPLICATE_DISTANCE = 0.4
+
+
+def valid_roll(roll):
+    """Roll numbers name files under data/images, so they must not be able to leave it."""
+    return isinstance(roll, str) and bool(roll) and '..' not in roll and not any(char in roll for char in '/\\\0\r\n')
+
+
+def read_roster(file):
+    """Read (roll, name[, photo]) rows; a leading "roll,name" header is skipped.
+
+    Raises ValueError for a roll number that is not valid_roll().
+    """
+    roster = []
+    for line, row in enumerate(csv.reader(file), 1):
+        if len(row) < 2 or not row[0].strip():
+            continue
+        if not roster and row[0].strip().lower() == 'roll':
+            continue
+        if not valid_roll(row[0].strip()):
+            raise ValueError(f"Invalid roll number on roster line {line}: {row[0].strip()!r}")
+        photo = row[2].strip() if len(row) > 2 and row[2].strip() else None
+        roster.append((row[0].strip(), row[1].strip(), photo))
+    return roster
+
+
+def list_photos(source):
+    """Map photo filename -> (path, zip member or None) for a directory or zip file."""
+    photos = {}
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.namelist():
+                filename = os.path.basename(member)
+                if filename.lower().endswith(IMAGE_EXTENSIONS) and not filename.startswith('.'):
+                    photos[filename] = (source, member)
+    else:
+        for filename in os.listdir(source):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                photos[filename] = (os.path.join(source, filename), None)
+    return photos
+
+
+def read_photo(path, member):
+    if member is None:
+        with open(path, 'rb') as file:
+            return file.read()
+    with zipfile.ZipFile(path) as archive:
+        return archive.read(member)
+
+
+def _encode_photo(job):
+    import cv2
+    import numpy as np
+    import face_recognition
+    roll, path, member = job
+    try:
+        data = read_photo(path, member)
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return roll, 'unreadable', None
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        locations = face_recognition.face_locations(image)
+        if not locations:
+            return roll, 'no_face', None
+        if len(locations) > 1:
+            return roll, 'multiple_faces', None
+        return roll, 'ok', face_recognition.face_encodings(image, locations)[0]
+    except Exception as e:
+        print(f"Error encoding photo for {roll}: {str(e)}")
+        return roll, 'unreadable', None
+
+
+def encode_roster(roster, photos, known_faces, workers=None, duplicate_distance=DUPLICATE_DISTANCE,
+                  progress_every=100):
+    """Encode one photo per roster row in parallel and decide who can be enrolled.
+
+    Returns (accepted, skipped): accepted is a list of (roll, name, encoding,
+    photo filename); skipped is a list of {'roll', 'reason'} dicts, with
+    'match' naming the existing student for duplicate faces.
+    """
+    by_stem = {os.path.splitext(filename)[0]: filename for filename in photos}
+    skipped = []
+    jobs = []
+    names = {}
+    seen = set()
+    for roll, name, photo in roster:
+        if roll in seen:
+            skipped.append({'roll': roll, 'reason': 'duplicate_roll'})
+            continue
+        seen.add(roll)
+        if roll in known_faces:
+            skipped.append({'roll': roll, 'reason': 'already_enrolled'})
+            continue
+        filename = photo if photo in photos else by_stem.get(roll)
+        if filename is None:
+            skipped.append({'roll': roll, 'reason': 'no_photo'})
+            continue
+        names[roll] = (name, filename)
+        jobs.append((roll,) + photos[filename])
+
+    candidates = []
+    if jobs:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, min(32, len(jobs) // (workers * 4)))
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for done, (roll, status, encoding) in enumerate(executor.map(_encode_photo, jobs, chunksize=chunksize), 1):
+                if status == 'ok':
+                    candidates.append((roll, encoding))
+                else:
+                    skipped.append({'roll': roll, 'reason': status})
+                if done % progress_every == 0 or done == len(jobs):
+                    print(f"  {done}/{len(jobs)} photos, {done / (time.perf_counter() - start):.1f} photos/s")
+
+    # The same face under two roll numbers, against the gallery and within the batch
+    accepted = []
+    batch = FaceGallery()
+    existing = known_faces.match([encoding for _, encoding in candidates], duplicate_distance) if candidates else []
+    for (roll, encoding), (match, _) in zip(candidates, existing):
+        if match is None:
+            match = batch.match([encoding], duplicate_distance)[0][0]
+        if match is not None:
+            skipped.append({'roll': roll, 'reason': 'duplicate_face', 'match': match})
+            continue
+        batch.add(encoding, roll)
+        name, filename = names[roll]
+        accepted.append((roll, name, encoding, filename))
+    return accepted, skipped
+
+
+def save_photos(accepted, photos, images_dir):
+    """Copy accepted photos to images_dir as <roll><ext>, so gallery sync keeps them."""
+    for roll, _, _, filename in accepted:
+        if not valid_roll(roll):
+            raise ValueError(f"Invalid roll number: {roll!r}")
+        extension = os.path.splitext(filename)[1].lower()
+        with open(os.path.join(images_dir, f"{roll}{extension}"), 'wb') as file:
+            file.write(read_photo(*photos[filename]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enrol students in bulk from a roster and their photos")
+    parser.add_argument("photos", help="directory or zip file of photos named <roll>.jpg (or listed in the roster)")
+    parser.add_argument("--roster", required=True, help="CSV of roll,name[,photo filename]")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--workers", type=int, default=None, help="encoding processes (default: all cores)")
+    parser.add_argument("--duplicate-distance", type=float, default=DUPLICATE_DISTANCE,
+                        help="reject faces this close to an enrolled face (default %(default)s)")
+    args = parser.parse_args()
+
+    from database import AttendanceDatabase
+
+    start = time.perf_counter()
+    images_dir = os.path.join(args.data_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    store = EmbeddingStore(os.path.join(args.data_dir, "face_encodings"))
+    known_faces = store.load() if store.exists() else FaceGallery()
+    with open(args.roster, 'r', encoding='utf-8-sig', newline='') as file:
+        try:
+            roster = read_roster(file)
+        except ValueError as e:
+            parser.error(str(e))
+    photos = list_photos(args.photos)
+
+    accepted, skipped = encode_roster(roster, photos, known_faces, args.workers, args.duplicate_distance)
+    if accepted:
+        save_photos(accepted, photos, images_dir)
+        store.extend([encoding for _, _, encoding, _ in accepted], [roll for roll, _, _, _ in accepted])
+        db = AttendanceDatabase(os.path.join(args.data_dir, "attendance.db"))
+        db.import_students((roll, name) for roll, name, _, _ in accepted)
+
+    for entry in skipped:
+        match = f" (matches {entry['match']})" if 'match' in entry else ""
+        print(f"Skipped {entry['roll']}: {entry['reason']}{match}")
+    print(f"Enrolled {len(accepted)} of {len(roster)} students in {time.perf_counter() - start:.1f}s; "
+          f"{len(skipped)} skipped.")
+
+
+if __name__ == '__main__':
+    main()
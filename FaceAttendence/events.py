@@ -0,0 +1,122 @@
+import itertools
+import json
+import threading
+from collections import OrderedDict
+
+
+class Subscriber:
+    """Events waiting for one client, bounded and coalescing.
+
+    Events published with the same key replace each other, so a slow client
+    only sees the latest "unknown face" update rather than every one. Once
+    more than `size` events are waiting, the oldest are dropped and counted;
+    the client should then reload its state instead of trusting the gaps.
+    `on_event` is called after each put, e.g. to wake an asyncio task.
+    """
+
+    def __init__(self, size, on_event=None):
+        self.size = size
+        self.on_event = on_event
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()
+        self._sequence = itertools.count()
+        self._dropped = 0
+
+    def put(self, event, key=None):
+        with self._cond:
+            if key is None:
+                key = ('seq', next(self._sequence))
+            else:
+                self._pending.pop(key, None)
+            self._pending[key] = event
+            while len(self._pending) > self.size:
+                self._pending.popitem(last=False)
+                self._dropped += 1
+            self._cond.notify()
+        if self.on_event is not None:
+            self.on_event()
+
+    def drain(self, timeout=None):
+        """Return (events, dropped) waiting now, blocking up to timeout for the first one."""
+        with self._cond:
+            if not self._pending and timeout:
+                self._cond.wait(timeout)
+            events = list(self._pending.values())
+            dropped = self._dropped
+            self._pending.clear()
+            self._dropped = 0
+        return events, dropped
+
+
+def format_events(events, dropped=0, snapshot=None):
+    """Server-sent-event text for a batch of events.
+
+    After dropped events the client gets a fresh snapshot() in place of the
+    gap, or an "overflow" event when the topic has no snapshot.
+    """
+    chunks = []
+    if dropped:
+        if snapshot is not None:
+            chunks.append(f"data: {json.dumps(snapshot())}\n\n")
+        else:
+            chunks.append(f"event: overflow\ndata: {json.dumps({'dropped': dropped})}\n\n")
+    chunks.extend(f"data: {json.dumps(event)}\n\n" for event in events)
+    return ''.join(chunks)
+
+
+class Broadcaster:
+    """Fans events out to subscribers, each with its own bounded, coalescing buffer.
+
+    A subscriber that falls behind has its events coalesced and then its
+    oldest ones dropped, instead of blocking the publisher or growing
+    without bound. Publishing to a topic nobody follows costs one lookup.
+    """
+
+    def __init__(self, buffer_size=32):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, topic, on_event=None):
+        subscriber = Subscriber(self.buffer_size, on_event)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, topic, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, topic, event, key=None):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            subscriber.put(event, key)
+
+    def stream(self, topic, keepalive=15.0, snapshot=None):
+        """Generator of server-sent-event text for one subscriber.
+
+        snapshot, if given, returns the topic's current state as an event;
+        it is sent first and again whenever events had to be dropped.
+        """
+        subscriber = self.subscribe(topic)
+        try:
+            yield ": connected\n\n"
+            if snapshot is not None:
+                yield format_events([snapshot()])
+            while True:
+                events, dropped = subscriber.drain(keepalive)
+                if not events and not dropped:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_events(events, dropped, snapshot)
+        finally:
+            self.unsubscribe(topic, subscriber)
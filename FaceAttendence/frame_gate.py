@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def dhash(image_bytes):
+    """64-bit difference hash of a JPEG, or None if it cannot be decoded.
+
+    Decodes at 1/8 scale in grayscale, which is far cheaper than a full decode.
+    """
+    small = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    small = cv2.resize(small, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class FrameGate:
+    """Remembers the last frame hash and result per session.
+
+    A frame whose hash is within max_distance bits of the previous frame from
+    the same session reuses that frame's result, as long as the result is
+    younger than max_age and was computed under the same state key.
+    """
+
+    def __init__(self, max_distance=3, max_age=10.0, max_sessions=64):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.client_skipped = 0
+
+    def count_client_skips(self, value):
+        # Frames the page chose not to upload, reported with the next upload
+        try:
+            skipped = int(value or 0)
+        except ValueError:
+            return
+        with self._lock:
+            self.client_skipped += max(0, skipped)
+
+    def lookup(self, session_id, frame_hash, state):
+        if session_id is None or frame_hash is None:
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                previous_hash, result, stored_state, stored_at = entry
+                if (stored_state == state and time.monotonic() - stored_at < self.max_age
+                        and bin(previous_hash ^ frame_hash).count('1') <= self.max_distance):
+                    self._sessions.move_to_end(session_id)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def store(self, session_id, frame_hash, state, result):
+        if session_id is None or frame_hash is None or 'error' in result:
+            return
+        with self._lock:
+            self._sessions[session_id] = (frame_hash, result, state, time.monotonic())
+            self._sessions.move_to_end(session_id)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
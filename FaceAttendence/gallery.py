@@ -0,0 +1,155 @@
+import pickle
+
+import numpy as np
+
+ENCODING_SIZE = 128
+DEFAULT_TOLERANCE = 0.6
+GROWTH_CHUNK = 1024
+
+
+class FaceGallery:
+    """Known face encodings kept in one contiguous float32 (N, 128) matrix.
+
+    A student may have several rows (reference templates) under the same id;
+    _rows maps each id to its row numbers. Matching takes the nearest row, so
+    a student's distance is the minimum over their templates.
+    """
+
+    def __init__(self, encodings=None, ids=None, chunk=GROWTH_CHUNK):
+        self.chunk = chunk
+        self._matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self.ids = []
+        self._rows = {}
+        self.index = None
+        # Bumped on every change so callers can drop results cached against older contents
+        self.version = 0
+        if encodings is not None and len(encodings):
+            self.extend(encodings, ids)
+
+    @classmethod
+    def from_matrix(cls, matrix, ids):
+        """Wrap an existing (N, 128) float32 array, e.g. a memmap, without copying it.
+
+        The array is only copied once the gallery outgrows it on the next add.
+        """
+        known_faces = cls()
+        known_faces._matrix = matrix
+        known_faces._sq_norms = np.einsum('ij,ij->i', matrix, matrix).astype(np.float32)
+        known_faces.ids = list(ids)
+        for row, face_id in enumerate(known_faces.ids):
+            known_faces._rows.setdefault(face_id, []).append(row)
+        known_faces.version = 1
+        return known_faces
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, face_id):
+        return face_id in self._rows
+
+    @property
+    def encodings(self):
+        return self._matrix[:len(self.ids)]
+
+    @property
+    def identities(self):
+        """Distinct ids, in the order they were first added."""
+        return list(self._rows)
+
+    def template_count(self, face_id):
+        return len(self._rows.get(face_id, ()))
+
+    def templates(self, face_id):
+        return self._matrix[self._rows.get(face_id, [])]
+
+    def _reserve(self, size):
+        capacity = self._matrix.shape[0]
+        if size <= capacity:
+            return
+        # Grow in whole chunks so repeated single appends stay amortized O(1)
+        new_capacity = max(size, capacity + self.chunk, capacity * 2)
+        matrix = np.empty((new_capacity, ENCODING_SIZE), dtype=np.float32)
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        count = len(self.ids)
+        matrix[:count] = self._matrix[:count]
+        sq_norms[:count] = self._sq_norms[:count]
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+
+    def add(self, encoding, face_id):
+        self.extend([encoding], [face_id])
+
+    def extend(self, encodings, ids):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        ids = list(ids)
+        if len(ids) != encodings.shape[0]:
+            raise ValueError("Number of ids does not match number of encodings")
+        start = len(self.ids)
+        end = start + len(ids)
+        self._reserve(end)
+        self._matrix[start:end] = encodings
+        self._sq_norms[start:end] = np.einsum('ij,ij->i', encodings, encodings)
+        self.ids.extend(ids)
+        for row, face_id in enumerate(ids, start):
+            self._rows.setdefault(face_id, []).append(row)
+        self.version += 1
+        if self.index is not None:
+            if self.index.needs_retrain(len(self.ids)):
+                self.index.train(self.encodings)
+            else:
+                self.index.add(encodings)
+
+    def attach_index(self, index):
+        """Use an approximate index (e.g. IVFFlatIndex) for match().
+
+        An untrained index is trained on the current encodings; until the
+        gallery is large enough to train it, match() keeps scanning exactly.
+        """
+        self.index = index
+        if index is not None and index.size != len(self.ids):
+            index.train(self.encodings)
+
+    def distances(self, face_encodings):
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = len(self.ids)
+        if count == 0 or queries.shape[0] == 0:
+            return np.empty((queries.shape[0], count), dtype=np.float32)
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, computed for every pair in one matmul
+        sq = np.einsum('ij,ij->i', queries, queries)[:, None] + self._sq_norms[:count][None, :]
+        sq -= 2.0 * (queries @ self._matrix[:count].T)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def match(self, face_encodings, tolerance=DEFAULT_TOLERANCE):
+        """Return (id, distance) of the nearest known face for each encoding.
+
+        id is None when the gallery is empty or the nearest face is further
+        than tolerance.
+        """
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = len(self.ids)
+        if count == 0:
+            return [(None, None) for _ in range(queries.shape[0])]
+        if self.index is not None and self.index.trained and queries.shape[0]:
+            best, best_dist = self.index.search(queries, self._matrix[:count], self._sq_norms[:count])
+        else:
+            dist = self.distances(queries)
+            best = np.argmin(dist, axis=1)
+            best_dist = dist[np.arange(dist.shape[0]), best]
+        results = []
+        for index, distance in zip(best.tolist(), best_dist.tolist()):
+            if index < 0:
+                results.append((None, None))
+            elif distance <= tolerance:
+                results.append((self.ids[index], distance))
+            else:
+                results.append((None, distance))
+        return results
+
+
+def load_gallery_file(path):
+    # The (list of encodings, list of ids) pickle used before the embedding store
+    with open(path, 'rb') as file:
+        face_encodings, face_ids = pickle.load(file)
+    return FaceGallery(face_encodings, face_ids)
@@ -0,0 +1,49 @@
+import atexit
+import os
+import queue
+import threading
+
+import cv2
+
+
+class ImageWriter:
+    """Writes images to disk on a background thread.
+
+    Each image is written to a temporary file and renamed into place, so a
+    crash never leaves a half-written image for the gallery sync to encode.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="image-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def save(self, path, image):
+        self._queue.put((path, image))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, image = item
+            tmp_path = path + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ok, data = cv2.imencode(os.path.splitext(path)[1], image)
+                if not ok:
+                    raise OSError(f"Could not encode {path}")
+                with open(tmp_path, 'wb') as file:
+                    file.write(data.tobytes())
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Error saving image {path}: {str(e)}")
@@ -0,0 +1,255 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from gallery import ENCODING_SIZE, GROWTH_CHUNK
+
+# Row layout of the shared block: `capacity` encodings followed by their
+# squared norms, all float32
+_ROW_BYTES = ENCODING_SIZE * 4
+
+
+def _gallery_views(buf, capacity):
+    matrix = np.ndarray((capacity, ENCODING_SIZE), dtype=np.float32, buffer=buf)
+    sq_norms = np.ndarray((capacity,), dtype=np.float32, buffer=buf, offset=capacity * _ROW_BYTES)
+    return matrix, sq_norms
+
+
+class SharedGallery:
+    """Append-only copy of the gallery matrix in shared memory for the workers.
+
+    Only the parent process writes. Workers attach by name and read the first
+    `count` rows, so a publish never moves rows a worker might be reading.
+    """
+
+    def __init__(self, chunk=GROWTH_CHUNK):
+        self.chunk = chunk
+        self._shm = None
+        self._retired = []
+        self.capacity = 0
+        self.count = 0
+        self.ref = None
+
+    def publish(self, known_faces):
+        count = len(known_faces)
+        if self._shm is None or count < self.count:
+            # First publish, or rows were removed: start over with a fresh block
+            self.count = 0
+            self._reallocate(max(count, self.chunk))
+        elif count > self.capacity:
+            self._reallocate(max(count, self.capacity + self.chunk, self.capacity * 2))
+        matrix, sq_norms = _gallery_views(self._shm.buf, self.capacity)
+        start = self.count
+        matrix[start:count] = known_faces.encodings[start:count]
+        sq_norms[start:count] = np.einsum('ij,ij->i', matrix[start:count], matrix[start:count])
+        self.count = count
+        # Workers get the reference with each batch; swapping the tuple is atomic
+        self.ref = (self._shm.name, self.capacity, self.count)
+
+    def _reallocate(self, capacity):
+        shm = shared_memory.SharedMemory(create=True, size=capacity * (_ROW_BYTES + 4))
+        if self._shm is not None:
+            old_matrix, old_norms = _gallery_views(self._shm.buf, self.capacity)
+            matrix, sq_norms = _gallery_views(shm.buf, capacity)
+            matrix[:self.count] = old_matrix[:self.count]
+            sq_norms[:self.count] = old_norms[:self.count]
+            del old_matrix, old_norms, matrix, sq_norms
+            # In-flight batches may still name the old block; unlink it later
+            self._retired.append(self._shm)
+        self._shm = shm
+        self.capacity = capacity
+        while len(self._retired) > 2:
+            self._release(self._retired.pop(0))
+
+    @staticmethod
+    def _release(shm):
+        shm.close()
+        shm.unlink()
+
+    def close(self):
+        for shm in self._retired + ([self._shm] if self._shm is not None else []):
+            self._release(shm)
+        self._retired = []
+        self._shm = None
+        self.ref = None
+
+
+# Worker-process side
+
+_worker_gallery = {}
+
+
+def _worker_init():
+    # Load the dlib models once per worker rather than once per batch
+    global detect_faces, encode_faces
+    from detection import detect_faces, encode_faces, load_models
+    load_models()
+
+
+def _worker_ping():
+    return True
+
+
+def _attach(ref):
+    name, capacity, _ = ref
+    cached = _worker_gallery.get('shm')
+    if cached is None or cached.name != name:
+        if cached is not None:
+            _worker_gallery.clear()
+            cached.close()
+        cached = shared_memory.SharedMemory(name=name)
+        _worker_gallery['shm'] = cached
+        _worker_gallery['views'] = _gallery_views(cached.buf, capacity)
+    return _worker_gallery['views']
+
+
+def _recognize_batch(payloads, ref, detection_options, quality_gate=None):
+    """Detect, encode and match every frame of a batch in one worker call.
+
+    Returns one list per frame of (location, encoding, row, distance, score,
+    reason); row is -1 when the gallery is empty. Faces the quality gate
+    rejects are not encoded and come back with the rejection reason, no
+    encoding and row -1.
+    """
+    faces_per_frame = []
+    encodings = []
+    for image_bytes in payloads:
+        frame = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            faces_per_frame.append(None)
+            continue
+        face_locations = detect_faces(frame, **detection_options)
+        if quality_gate is not None:
+            qualities = quality_gate.assess(frame, face_locations)
+        else:
+            qualities = [(None, None)] * len(face_locations)
+        faces_per_frame.append(list(zip(face_locations, qualities)))
+        encodings.extend(encode_faces(frame, [location for location, (_, reason) in zip(face_locations, qualities)
+                                              if reason is None]))
+
+    count = ref[2] if ref is not None else 0
+    rows = np.full(len(encodings), -1, dtype=np.int64)
+    distances = np.full(len(encodings), np.inf, dtype=np.float32)
+    if encodings and count:
+        matrix, sq_norms = _attach(ref)
+        queries = np.asarray(encodings, dtype=np.float32)
+        # One distance computation for all faces of all frames in the batch
+        sq = np.einsum('ij,ij->i', queries, queries)[:, None] + sq_norms[None, :count]
+        sq -= 2.0 * (queries @ matrix[:count].T)
+        np.maximum(sq, 0.0, out=sq)
+        rows = np.argmin(sq, axis=1)
+        distances = np.sqrt(sq[np.arange(len(rows)), rows])
+
+    results = []
+    offset = 0
+    for frame_faces in faces_per_frame:
+        if frame_faces is None:
+            results.append(None)
+            continue
+        faces = []
+        for location, (score, reason) in frame_faces:
+            if reason is not None:
+                faces.append((location, None, -1, None, score, reason))
+                continue
+            faces.append((location, encodings[offset], int(rows[offset]), float(distances[offset]), score, None))
+            offset += 1
+        results.append(faces)
+    return results
+
+
+# Parent-process side
+
+class InferencePool:
+    """Process pool that micro-batches frames from many cameras.
+
+    submit() returns a Future per frame. A dispatcher thread groups queued
+    frames into batches of at most max_batch, waiting at most max_wait
+    seconds after the first frame for others to arrive.
+    """
+
+    def __init__(self, workers, max_batch=8, max_wait=0.01, detection_options=None, quality_gate=None):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.detection_options = detection_options or {}
+        self.quality_gate = quality_gate
+        self.gallery = SharedGallery()
+        self._queue = queue.Queue()
+        self._executor = None
+        self._dispatcher = None
+        self._running = False
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def start(self, known_faces):
+        self.publish(known_faces)
+        # Fork the workers now, from the main thread, before Flask starts serving
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('fork'),
+                                             initializer=_worker_init)
+        for future in [self._executor.submit(_worker_ping) for _ in range(self.workers)]:
+            future.result()
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch, name="inference-dispatcher", daemon=True)
+        self._dispatcher.start()
+        print(f"Inference pool started with {self.workers} workers.")
+
+    def publish(self, known_faces):
+        self.gallery.publish(known_faces)
+
+    def submit(self, image_bytes):
+        future = Future()
+        self._queue.put((image_bytes, future))
+        return future
+
+    def _dispatch(self):
+        while self._running:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            payloads = [image_bytes for image_bytes, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                task = self._executor.submit(_recognize_batch, payloads, self.gallery.ref,
+                                             self.detection_options, self.quality_gate)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            task.add_done_callback(lambda done, futures=futures: self._resolve(done, futures))
+
+    @staticmethod
+    def _resolve(done, futures):
+        error = done.exception()
+        if error is not None:
+            for future in futures:
+                future.set_exception(error)
+            return
+        for future, result in zip(futures, done.result()):
+            future.set_result(result)
+
+    def shutdown(self):
+        self._running = False
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.gallery.close()
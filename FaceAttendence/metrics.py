@@ -0,0 +1,216 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 1024
+MAX_CAMERAS = 64
+# A camera without frames for this long gives up its label to a new one
+CAMERA_IDLE_SECONDS = 300
+OTHER_CAMERA = "other"
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RollingWindow:
+    """Last WINDOW samples in a ring buffer, plus running count and sum."""
+
+    def __init__(self, size=WINDOW):
+        self._samples = np.zeros(size, dtype=np.float64)
+        self._next = 0
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self._samples[self._next] = value
+        self._next = (self._next + 1) % len(self._samples)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        filled = min(self.count, len(self._samples))
+        if filled == 0:
+            return [float('nan')] * len(QUANTILES)
+        return np.quantile(self._samples[:filled], QUANTILES).tolist()
+
+
+class Metrics:
+    """Per-stage and per-camera latency windows for the frame pipeline.
+
+    frame(camera) wraps one frame; stage(name) inside it times a pipeline step
+    for that camera. Timings are kept per thread, so concurrent requests from
+    different cameras do not mix.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = {}
+        self._cameras = OrderedDict()
+        # Pooled cameras beyond MAX_CAMERAS; kept apart so they never hold one of the ordered slots
+        self._other = {'frames': 0, 'times': RollingWindow(64), 'last': 0.0}
+        self._faces = RollingWindow()
+        self.gauges = {}
+
+    def _camera_label(self, camera):
+        camera = camera or "none"
+        with self._lock:
+            if camera == OTHER_CAMERA:
+                return camera
+            if camera in self._cameras:
+                self._cameras.move_to_end(camera)
+                return camera
+            if len(self._cameras) >= MAX_CAMERAS:
+                # Cameras are kept least recently used first, so only the first can be the idlest
+                oldest = next(iter(self._cameras))
+                if time.time() - self._cameras[oldest]['last'] < CAMERA_IDLE_SECONDS:
+                    # Bound label cardinality; new cameras past the limit are pooled
+                    return OTHER_CAMERA
+                self._forget(oldest)
+            self._cameras[camera] = {'frames': 0, 'times': RollingWindow(64), 'last': time.time()}
+            return camera
+
+    def _forget(self, camera):
+        self._cameras.pop(camera, None)
+        for key in [key for key in self._stages if key[1] == camera]:
+            del self._stages[key]
+
+    def forget_camera(self, camera):
+        """Drop a camera's series, e.g. when its session is closed, so its label can be reused."""
+        with self._lock:
+            self._forget(camera or "none")
+
+    def observe(self, stage, seconds, camera=None):
+        camera = camera if camera is not None else getattr(self._local, 'camera', "none")
+        key = (stage, camera)
+        with self._lock:
+            window = self._stages.get(key)
+            if window is None:
+                window = self._stages[key] = RollingWindow()
+            window.observe(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def frame(self, camera=None):
+        camera = self._camera_label(camera)
+        self._local.camera = camera
+        self._local.faces = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('total', time.perf_counter() - start, camera)
+            now = time.time()
+            with self._lock:
+                stats = self._cameras.get(camera, self._other)
+                stats['frames'] += 1
+                stats['last'] = now
+                stats['times'].observe(now)
+                if self._local.faces is not None:
+                    self._faces.observe(self._local.faces)
+            self._local.camera = "none"
+
+    def set_faces(self, count):
+        self._local.faces = count
+
+    def _frame_rate(self, times):
+        filled = min(times.count, len(times._samples))
+        if filled < 2:
+            return 0.0
+        samples = times._samples[:filled]
+        span = samples.max() - samples.min()
+        return (filled - 1) / span if span > 0 else 0.0
+
+    def render(self):
+        """Prometheus text exposition of everything collected so far."""
+        lines = [
+            "# HELP face_stage_seconds Latency of each frame processing stage.",
+            "# TYPE face_stage_seconds summary",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            cameras = [(camera, stats['frames'], self._frame_rate(stats['times']))
+                       for camera, stats in self._cameras.items()]
+            if self._other['frames']:
+                cameras.append((OTHER_CAMERA, self._other['frames'], self._frame_rate(self._other['times'])))
+            faces = (self._faces.quantiles(), self._faces.count, self._faces.total)
+        for (stage, camera), window in stages:
+            labels = f'stage="{escape_label(stage)}",camera="{escape_label(camera)}"'
+            for quantile, value in zip(QUANTILES, window.quantiles()):
+                lines.append(f'face_stage_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'face_stage_seconds_count{{{labels}}} {window.count}')
+            lines.append(f'face_stage_seconds_sum{{{labels}}} {window.total:.6f}')
+        lines += ["# HELP face_frames_total Frames processed per camera.", "# TYPE face_frames_total counter"]
+        lines += [f'face_frames_total{{camera="{escape_label(camera)}"}} {frames}' for camera, frames, _ in cameras]
+        lines += ["# HELP face_frame_rate Recent frames per second per camera.", "# TYPE face_frame_rate gauge"]
+        lines += [f'face_frame_rate{{camera="{escape_label(camera)}"}} {rate:.3f}' for camera, _, rate in cameras]
+        lines += ["# HELP face_faces_per_frame Faces detected per frame.", "# TYPE face_faces_per_frame summary"]
+        for quantile, value in zip(QUANTILES, faces[0]):
+            lines.append(f'face_faces_per_frame{{quantile="{quantile}"}} {value:.3f}')
+        lines.append(f'face_faces_per_frame_count {faces[1]}')
+        lines.append(f'face_faces_per_frame_sum {faces[2]:.0f}')
+        for name, read in sorted(self.gauges.items()):
+            lines += [f"# TYPE {name} gauge", f"{name} {read()}"]
+        return "\n".join(lines) + "\n"
+
+
+class FrameProfiler:
+    """Runs cProfile over the next N frames when armed, then dumps the stats."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._profile = None
+        self.last_report = None
+
+    def arm(self, frames):
+        with self._lock:
+            self._profile = cProfile.Profile()
+            self._remaining = frames
+
+    @contextlib.contextmanager
+    def maybe_profile(self):
+        if self._remaining <= 0:
+            yield
+            return
+        # Profiled frames are serialized; cProfile can only follow one thread
+        with self._lock:
+            profile = self._profile
+            if self._remaining <= 0 or profile is None:
+                yield
+                return
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._dump(profile)
+
+    def _dump(self, profile):
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profile.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(30)
+        self.last_report = {'path': path, 'report': text.getvalue()}
+        self._profile = None
+        print(f"Saved frame profile to {path}")
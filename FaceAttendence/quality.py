@@ -0,0 +1,68 @@
+import cv2
+
+# Sharpness is measured on the face resized to this size, so it does not depend on distance
+SHARPNESS_SIZE = 64
+# Size and sharpness at which a face counts as fully good when ranking crops
+GOOD_FACE_SIZE = 160
+GOOD_SHARPNESS = 200.0
+
+
+def sharpness(frame, location):
+    """Variance of the Laplacian of the face, a standard blur measure: low means blurred."""
+    top, right, bottom, left = location
+    crop = frame[top:bottom, left:right]
+    if crop.size == 0:
+        return 0.0
+    grey = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    grey = cv2.resize(grey, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(grey, cv2.CV_64F).var())
+
+
+class FaceQualityGate:
+    """Decides which detected faces are worth the cost of an encoding.
+
+    Checks run cheapest first: box size, then blur, then head yaw from
+    landmarks, which only runs on faces that passed the first two. A
+    threshold of 0 turns its check off. `yaw` is a function of (frame,
+    locations) returning one value per face, 0 for frontal and up to 1 for
+    a full profile.
+    """
+
+    def __init__(self, min_size=40, min_sharpness=15.0, max_yaw=0.6, yaw=None):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.yaw = yaw
+        self.rejected = {'size': 0, 'blur': 0, 'pose': 0}
+
+    def assess(self, frame, face_locations):
+        """Return (score, reason) for each face: reason is None for faces to encode.
+
+        score ranks accepted faces from 0 to 1 by size, sharpness and pose,
+        e.g. to keep the best of several crops of the same person.
+        """
+        results = [None] * len(face_locations)
+        pending = []
+        for i, location in enumerate(face_locations):
+            top, right, bottom, left = location
+            size = min(bottom - top, right - left)
+            if size < self.min_size:
+                results[i] = (0.0, 'size')
+                continue
+            sharp = sharpness(frame, location)
+            if sharp < self.min_sharpness:
+                results[i] = (0.0, 'blur')
+                continue
+            pending.append((i, min(size / GOOD_FACE_SIZE, 1.0) * min(sharp / GOOD_SHARPNESS, 1.0)))
+        yaws = [0.0] * len(pending)
+        if self.max_yaw > 0 and self.yaw is not None and pending:
+            yaws = self.yaw(frame, [face_locations[i] for i, _ in pending])
+        for (i, score), yaw in zip(pending, yaws):
+            if self.max_yaw > 0 and abs(yaw) > self.max_yaw:
+                results[i] = (0.0, 'pose')
+            else:
+                results[i] = (score * (1.0 - min(abs(yaw), 1.0)), None)
+        return results
+
+    def count_rejected(self, reason):
+        self.rejected[reason] += 1
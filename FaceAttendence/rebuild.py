@@ -0,0 +1,216 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from gallery import FaceGallery
+from embedding_store import EmbeddingStore
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, path)
+
+
+def scan_images(images_dir):
+    """Stat <roll>.<ext> files and <roll>/<name>.<ext> extra templates, keyed by relative path."""
+    entries = {}
+    if not os.path.exists(images_dir):
+        return entries
+    with os.scandir(images_dir) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = entry.stat()
+                entries[entry.name] = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            elif entry.is_dir():
+                with os.scandir(entry.path) as sub:
+                    for image in sub:
+                        if image.is_file() and image.name.lower().endswith(IMAGE_EXTENSIONS):
+                            stat = image.stat()
+                            entries[f"{entry.name}/{image.name}"] = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    return entries
+
+
+def identity_of(filename):
+    if '/' in filename:
+        return filename.split('/', 1)[0]
+    return os.path.splitext(filename)[0]
+
+
+def _encode_image(path):
+    import face_recognition
+    try:
+        image = face_recognition.load_image_file(path)
+        encodings = face_recognition.face_encodings(image)
+    except Exception as e:
+        print(f"Error loading {path}: {str(e)}")
+        return None
+    return encodings[0] if encodings else None
+
+
+def plan_rebuild(images_dir, manifest, known_faces):
+    """Split the image directory into unchanged and to-encode students.
+
+    A student's templates are reused only if none of their images changed
+    and the gallery holds one template per image with a face; otherwise all
+    of their images are encoded again, since rows are not tied to files.
+
+    Returns (manifest, keep, encode): the updated manifest without hashes for
+    files still to encode, {face_id: templates} for students whose encodings
+    can be reused, and the filenames that need encoding.
+    """
+    manifest = manifest or {}
+    current = scan_images(images_dir)
+    by_identity = {}
+    for filename in sorted(current):
+        by_identity.setdefault(identity_of(filename), []).append(filename)
+    keep = {}
+    encode = []
+    for face_id, filenames in by_identity.items():
+        known = known_faces is not None and face_id in known_faces
+        all_unchanged = True
+        for filename in filenames:
+            stat = current[filename]
+            previous = manifest.get(filename)
+            if previous is None and known:
+                # Registered or encoded before the manifest knew about it: trust the gallery
+                previous = dict(stat, sha1=file_hash(os.path.join(images_dir, filename)), face=True)
+            if previous is not None and previous.get('mtime') == stat['mtime'] and previous.get('size') == stat['size']:
+                unchanged = True
+            elif previous is not None:
+                stat['sha1'] = file_hash(os.path.join(images_dir, filename))
+                unchanged = stat['sha1'] == previous.get('sha1')
+            else:
+                unchanged = False
+            if unchanged:
+                current[filename] = dict(stat, sha1=previous.get('sha1'), face=previous.get('face', False))
+            else:
+                all_unchanged = False
+        faces = sum(1 for filename in filenames if current[filename].get('face'))
+        count = known_faces.template_count(face_id) if known else 0
+        if all_unchanged and faces == count:
+            if faces:
+                keep[face_id] = known_faces.templates(face_id)
+        else:
+            encode.extend(filenames)
+    return current, keep, encode
+
+
+def rebuild_gallery(images_dir, manifest_path, known_faces=None, workers=None, full=False, progress_every=100):
+    """Bring the gallery in line with images_dir, encoding only what changed.
+
+    Returns (gallery, stats). Encodings of unchanged images are copied from
+    known_faces; students whose images the manifest listed but which are now
+    gone are dropped. Students with encodings but no image the manifest ever
+    saw are kept: their image is written after the encoding is stored, so a
+    crash in between must not lose the registration.
+    """
+    start = time.perf_counter()
+    manifest = None if full else load_manifest(manifest_path)
+    if full:
+        known_faces = None
+    listed = {identity_of(filename) for filename in manifest or {}}
+    manifest, keep, encode = plan_rebuild(images_dir, manifest, known_faces)
+    deleted = 0
+    unsaved = []
+    if known_faces is not None:
+        present = {identity_of(filename) for filename in manifest}
+        for face_id in known_faces.identities:
+            if face_id in present:
+                continue
+            if face_id in listed:
+                deleted += 1
+            else:
+                unsaved.append(face_id)
+                keep[face_id] = known_faces.templates(face_id)
+        if unsaved:
+            print(f"Keeping {len(unsaved)} students whose images were never saved: {', '.join(unsaved[:10])}")
+
+    encoded = {face_id: list(templates) for face_id, templates in keep.items()}
+    failed = []
+    if encode:
+        print(f"Encoding {len(encode)} images ({len(keep)} students unchanged, {deleted} deleted)...")
+        paths = [os.path.join(images_dir, filename) for filename in encode]
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, min(32, len(paths) // (workers * 4)))
+        encode_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_encode_image, paths, chunksize=chunksize)
+            for done, (filename, encoding) in enumerate(zip(encode, results), 1):
+                if not manifest[filename].get('sha1'):
+                    manifest[filename]['sha1'] = file_hash(os.path.join(images_dir, filename))
+                manifest[filename]['face'] = encoding is not None
+                if encoding is not None:
+                    encoded.setdefault(identity_of(filename), []).append(encoding)
+                else:
+                    failed.append(filename)
+                if done % progress_every == 0 or done == len(encode):
+                    elapsed = time.perf_counter() - encode_start
+                    print(f"  {done}/{len(encode)} images, {done / elapsed:.1f} images/s")
+
+    # Keep existing students in their order, then append new ones; each student's templates are contiguous
+    order = []
+    if known_faces is not None:
+        order = [face_id for face_id in known_faces.identities if face_id in encoded]
+    seen = set(order)
+    order.extend(sorted(face_id for face_id in encoded if face_id not in seen))
+    ids = [face_id for face_id in order for _ in encoded[face_id]]
+    rebuilt = FaceGallery([encoding for face_id in order for encoding in encoded[face_id]], ids)
+    save_manifest(manifest_path, manifest)
+
+    stats = {
+        'images': len(manifest),
+        'unchanged': len(manifest) - len(encode),
+        'encoded': len(encode) - len(failed),
+        'no_face': len(failed),
+        'deleted': deleted,
+        'seconds': time.perf_counter() - start,
+    }
+    return rebuilt, stats
+
+
+def main():
+    from snapshot import GallerySnapshot
+    parser = argparse.ArgumentParser(description="Rebuild face encodings from the images directory")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--workers", type=int, default=None, help="encoding processes (default: all cores)")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-encode every image")
+    args = parser.parse_args()
+
+    images_dir = os.path.join(args.data_dir, "images")
+    manifest_path = os.path.join(args.data_dir, "face_manifest.json")
+    store = EmbeddingStore(os.path.join(args.data_dir, "face_encodings"))
+
+    known_faces = store.load() if store.exists() else None
+    rebuilt, stats = rebuild_gallery(images_dir, manifest_path, known_faces, workers=args.workers, full=args.full)
+    store.write(rebuilt)
+    # Lets the app start from the store without checking the images again
+    GallerySnapshot(os.path.join(args.data_dir, "face_snapshot.json"), images_dir, store).save()
+    print(f"{stats['images']} images: {stats['unchanged']} unchanged, {stats['encoded']} encoded, "
+          f"{stats['no_face']} without a face, {stats['deleted']} deleted in {stats['seconds']:.1f}s")
+    print(f"Gallery now has {len(rebuilt)} faces.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, DEFAULT_TOLERANCE
+
+
+class RecognitionCache:
+    """Small LRU cache of recent (encoding -> id, distance) matches with a TTL.
+
+    Entries are keyed by the encoding quantized to `quantum`, so near-identical
+    encodings share one slot. A lookup hits when a cached encoding lies within
+    `radius` of the query and the cached answer cannot flip at that distance:
+    a known face needs distance + radius <= tolerance and an unknown face needs
+    distance - radius > tolerance. Everything is dropped when the gallery
+    version changes.
+    """
+
+    def __init__(self, size=512, ttl=30.0, radius=0.1, quantum=0.05):
+        self.size = size
+        self.ttl = ttl
+        self.radius = radius
+        self.quantum = quantum
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((size, ENCODING_SIZE), dtype=np.float32)
+        self._valid = np.zeros(size, dtype=bool)
+        self._slots = OrderedDict()
+        self._entries = [None] * size
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _key(self, encoding):
+        return np.round(encoding / self.quantum).astype(np.int16).tobytes()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._valid[:] = False
+        self._slots.clear()
+        self._entries = [None] * self.size
+
+    def _lookup(self, query, tolerance, now):
+        if not self._slots:
+            return None
+        dist = np.linalg.norm(self._vectors - query, axis=1)
+        dist[~self._valid] = np.inf
+        for slot in np.argsort(dist)[:4].tolist():
+            if dist[slot] > self.radius:
+                break
+            key, face_id, distance, expires = self._entries[slot]
+            if expires <= now:
+                self._evict(key)
+                continue
+            if face_id is not None and distance + self.radius <= tolerance:
+                self._slots.move_to_end(key)
+                return face_id, distance
+            if face_id is None and distance is not None and distance - self.radius > tolerance:
+                self._slots.move_to_end(key)
+                return None, distance
+        return None
+
+    def _evict(self, key):
+        slot = self._slots.pop(key)
+        self._valid[slot] = False
+        self._entries[slot] = None
+        return slot
+
+    def _store(self, query, face_id, distance, now):
+        if distance is None:
+            return
+        key = self._key(query)
+        if key in self._slots:
+            slot = self._slots[key]
+            self._slots.move_to_end(key)
+        elif len(self._slots) < self.size:
+            slot = int(np.flatnonzero(~self._valid)[0])
+            self._slots[key] = slot
+        else:
+            slot = self._evict(next(iter(self._slots)))
+            self.evictions += 1
+            self._slots[key] = slot
+        self._vectors[slot] = query
+        self._valid[slot] = True
+        self._entries[slot] = (key, face_id, distance, now + self.ttl)
+
+    def match(self, known_faces, face_encodings, tolerance=DEFAULT_TOLERANCE):
+        """Same results as known_faces.match(), answering from the cache where it can."""
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        results = [None] * queries.shape[0]
+        now = time.monotonic()
+        version = known_faces.version
+        with self._lock:
+            if version != self._version:
+                self._clear()
+                self._version = version
+            for i, query in enumerate(queries):
+                results[i] = self._lookup(query, tolerance, now)
+            missing = [i for i, result in enumerate(results) if result is None]
+            self.hits += len(results) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return results
+        matches = known_faces.match(queries[missing], tolerance)
+        with self._lock:
+            if version == self._version:
+                for i, (face_id, distance) in zip(missing, matches):
+                    self._store(queries[i], face_id, distance, now)
+        for i, match in zip(missing, matches):
+            results[i] = match
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._slots), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
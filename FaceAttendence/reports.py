@@ -0,0 +1,90 @@
+import base64
+import csv
+import io
+import json
+import time
+
+COLUMNS = ('session', 'class', 'session_started', 'roll', 'name', 'seen_at')
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# Rows fetched per database round trip while exporting; bounds the memory an export uses
+EXPORT_BATCH_SIZE = 1000
+
+
+def parse_time(value, end=False):
+    """Parse YYYY-MM-DD (local time) or epoch seconds; with end=True a date means the end of that day."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        day = time.mktime(time.strptime(value, '%Y-%m-%d'))
+    except ValueError:
+        raise ValueError(f"Invalid date: {value} (expected YYYY-MM-DD or epoch seconds)")
+    return day + 86400 if end else day
+
+
+def record_key(row):
+    # The (started_at, session_id, roll) sort key that attendance_page() resumes after
+    return row[2], row[0], row[3]
+
+
+def encode_cursor(row):
+    key = json.dumps(record_key(row)).encode('utf-8')
+    return base64.urlsafe_b64encode(key).decode('ascii')
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        started_at, session_id, roll = json.loads(base64.urlsafe_b64decode(value.encode('ascii')))
+        return float(started_at), str(session_id), str(roll)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def format_record(row):
+    session_id, class_name, started_at, roll, name, seen_at = row
+    return {
+        'session': session_id,
+        'class': class_name,
+        'session_started': _format_time(started_at),
+        'roll': roll,
+        'name': name or 'Unknown',
+        'seen_at': _format_time(seen_at),
+    }
+
+
+def iter_pages(db, filters, after=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield successive pages of db.attendance_page() until the records run out."""
+    while True:
+        rows = db.attendance_page(after=after, limit=batch_size, **filters)
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = record_key(rows[-1])
+
+
+def csv_chunks(pages):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for rows in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(format_record(row) for row in rows)
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(pages):
+    for rows in pages:
+        yield ''.join(json.dumps(format_record(row)) + '\n' for row in rows)
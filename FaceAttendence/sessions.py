@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_SESSION = "default"
+
+
+class ClassroomSession:
+    """Everything that belongs to one camera: its attendance, unknown face, tracker and counters.
+
+    `key` is the id the client sends (X-Session-Id); `attendance_session` is
+    the journal/database session the attendance is recorded under, which
+    changes every time the camera's attendance is cleared.
+    """
+
+    def __init__(self, key, attendance_session, class_name, tracker=None):
+        self.key = key
+        self.lock = threading.Lock()
+        # roll -> time first seen in the current attendance session
+        self.attendance = {}
+        self.attendance_session = attendance_session
+        self.class_name = class_name
+        self.last_unknown_face = None
+        self.tracker = tracker
+        self.stats = {'frames': 0, 'cached_frames': 0, 'known_faces': 0, 'unknown_faces': 0, 'rejected_faces': 0,
+                      'registered': 0}
+        self.created = time.time()
+        self.last_active = time.monotonic()
+
+    def describe(self):
+        with self.lock:
+            return {
+                'session': self.key,
+                'attendance_session': self.attendance_session,
+                'class': self.class_name,
+                'present': len(self.attendance),
+                'stats': dict(self.stats),
+                'idle_seconds': round(time.monotonic() - self.last_active, 1),
+            }
+
+
+class SessionRegistry:
+    """Bounded LRU of ClassroomSession objects that expires idle sessions.
+
+    get() creates missing sessions with factory(key). Sessions idle for longer
+    than idle_timeout, or least recently used once there are more than
+    max_sessions, are removed and handed to on_expire.
+    """
+
+    def __init__(self, factory, max_sessions=64, idle_timeout=7200.0, on_expire=None):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_expire = on_expire
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        key = key or DEFAULT_SESSION
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+            else:
+                session = self._sessions[key] = self.factory(key)
+            session.last_active = time.monotonic()
+            expired = self._collect_expired()
+        self._expire(expired)
+        return session
+
+    def peek(self, key):
+        with self._lock:
+            return self._sessions.get(key or DEFAULT_SESSION)
+
+    def add(self, session):
+        with self._lock:
+            self._sessions[session.key] = session
+            expired = self._collect_expired()
+        self._expire(expired)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def _collect_expired(self):
+        expired = []
+        now = time.monotonic()
+        # Oldest first, so stop at the first session that is still in use
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_active < self.idle_timeout:
+                break
+            del self._sessions[key]
+            expired.append(session)
+        return expired
+
+    def _expire(self, expired):
+        for session in expired:
+            if self.on_expire is not None:
+                try:
+                    self.on_expire(session)
+                except Exception as e:
+                    print(f"Error closing session {session.key}: {str(e)}")
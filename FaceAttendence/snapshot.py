@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+
+from rebuild import file_hash, scan_images
+
+
+def images_fingerprint(images_dir):
+    """Hash of every reference image's path, size and modification time; only stats the files."""
+    digest = hashlib.sha1()
+    for filename, stat in sorted(scan_images(images_dir).items()):
+        digest.update(f"{filename}\0{stat['size']}\0{stat['mtime']!r}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def store_hashes(store):
+    return {os.path.basename(path): file_hash(path)
+            for path in (store.matrix_path, store.ids_path, store.deleted_path) if os.path.exists(path)}
+
+
+class GallerySnapshot:
+    """Records that an embedding store is in sync with the images it was built from.
+
+    save() writes the images fingerprint and the content hash of the store
+    files. While both still match, startup can use the store as it is
+    instead of re-checking every image against it; any edit to the images
+    or to the store (a crash mid-append, compaction, a deletion) makes the
+    snapshot stale.
+    """
+
+    def __init__(self, path, images_dir, store):
+        self.path = path
+        self.images_dir = images_dir
+        self.store = store
+
+    def is_current(self):
+        if not os.path.exists(self.path) or not self.store.exists():
+            return False
+        try:
+            with open(self.path, 'r') as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return (saved.get('images') == images_fingerprint(self.images_dir)
+                and saved.get('store') == store_hashes(self.store))
+
+    def save(self):
+        snapshot = {'images': images_fingerprint(self.images_dir), 'store': store_hashes(self.store)}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+RECONNECT_DELAY = 2.0
+
+
+def parse_sources(value):
+    """Parse "name=source,name=source" from STREAM_SOURCES."""
+    sources = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, source = item.partition('=')
+        if not source:
+            raise ValueError(f"Invalid stream source: {item}")
+        sources[name.strip()] = source.strip()
+    return sources
+
+
+def source_allowed(source, allowed):
+    """Whether a runtime stream source matches one of the allowed source prefixes."""
+    return any(prefix and source.startswith(prefix) for prefix in allowed)
+
+
+class FrameBuffer:
+    """Bounded frame queue that drops the oldest frame when full."""
+
+    def __init__(self, size):
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, item):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(item)
+            self._cond.notify()
+
+    def take_latest(self, timeout):
+        """Return the newest frame and how many older ones were skipped to get it."""
+        with self._cond:
+            if not self._frames and not self._cond.wait(timeout):
+                return None, 0
+            if not self._frames:
+                return None, 0
+            item = self._frames.pop()
+            skipped = len(self._frames)
+            self._frames.clear()
+            return item, skipped
+
+
+class VideoStream:
+    """One reader thread and one recognition thread for a VideoCapture source.
+
+    The reader keeps the buffer fed in real time (pacing local files to their
+    frame rate). The recognition thread always takes the newest frame, so when
+    recognition is slower than the source it skips frames instead of falling
+    behind, and min_interval caps how often it runs.
+    """
+
+    def __init__(self, name, source, recognize, publish, buffer_size=2, min_interval=0.0):
+        self.name = name
+        self.source = int(source) if source.isdigit() else source
+        self.is_file = isinstance(self.source, str) and '://' not in self.source
+        self.recognize = recognize
+        self.publish = publish
+        self.min_interval = min_interval
+        self.buffer = FrameBuffer(buffer_size)
+        self.stats = {'read': 0, 'processed': 0, 'skipped': 0, 'errors': 0, 'process_ms': 0.0}
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._read_loop, name=f"stream-read-{self.name}", daemon=True),
+            threading.Thread(target=self._process_loop, name=f"stream-process-{self.name}", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    @property
+    def running(self):
+        return self._running
+
+    def _read_loop(self):
+        while self._running:
+            capture = cv2.VideoCapture(self.source)
+            if not capture.isOpened():
+                print(f"Could not open stream {self.name}, retrying...")
+                time.sleep(RECONNECT_DELAY)
+                continue
+            fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+            next_frame = time.monotonic()
+            while self._running:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                self.stats['read'] += 1
+                self.buffer.put(frame)
+                if self.is_file:
+                    # Files decode faster than real time; play them at their own frame rate
+                    next_frame += 1.0 / fps
+                    time.sleep(max(0.0, next_frame - time.monotonic()))
+            capture.release()
+            if self.is_file:
+                print(f"Stream {self.name} reached the end of {self.source}.")
+                self._running = False
+            elif self._running:
+                print(f"Stream {self.name} disconnected, reconnecting...")
+                time.sleep(RECONNECT_DELAY)
+
+    def _process_loop(self):
+        last_run = 0.0
+        while self._running or len(self.buffer):
+            wait = last_run + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            frame, skipped = self.buffer.take_latest(timeout=0.5)
+            if frame is None:
+                continue
+            self.stats['skipped'] += skipped
+            last_run = time.monotonic()
+            try:
+                result = self.recognize(frame, f"stream:{self.name}")
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Error processing stream {self.name}: {str(e)}")
+                continue
+            elapsed = (time.monotonic() - last_run) * 1000.0
+            self.stats['processed'] += 1
+            # Exponential moving average of recognition time per frame
+            self.stats['process_ms'] = 0.9 * self.stats['process_ms'] + 0.1 * elapsed
+            result['stream'] = self.name
+            result['timestamp'] = time.time()
+            self.publish(self.name, result)
+
+    def describe(self):
+        return dict(self.stats, name=self.name, source=str(self.source), running=self._running,
+                    dropped=self.buffer.dropped)
+
+
+class StreamManager:
+    def __init__(self, recognize, publish, buffer_size=2, min_interval=0.0):
+        self.recognize = recognize
+        self.publish = publish
+        self.buffer_size = buffer_size
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self.streams = {}
+
+    def start(self, name, source):
+        with self._lock:
+            existing = self.streams.get(name)
+            if existing is not None and existing.running:
+                raise ValueError(f"Stream {name} is already running")
+            stream = VideoStream(name, source, self.recognize, self.publish, self.buffer_size, self.min_interval)
+            self.streams[name] = stream
+        stream.start()
+        return stream
+
+    def stop(self, name):
+        with self._lock:
+            stream = self.streams.pop(name, None)
+        if stream is None:
+            return False
+        stream.stop()
+        return True
+
+    def describe(self):
+        with self._lock:
+            return [stream.describe() for stream in self.streams.values()]
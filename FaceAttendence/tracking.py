@@ -0,0 +1,90 @@
+import itertools
+import threading
+
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of (top, right, bottom, left) boxes as a (len(a), len(b)) array."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    def __init__(self, track_id, location, now):
+        self.id = track_id
+        self.location = location
+        self.last_seen = now
+        self.roll = None
+        self.distance = None
+        self.encoding = None
+        self.encoded_at = None
+        self.encoded_location = None
+        self.gallery_version = None
+
+
+class FaceTracker:
+    """Associates face boxes across frames of one camera by IoU.
+
+    A track keeps the identity from its last encoding, so faces that stay in
+    place only need a new encoding when the track is new, when the gallery has
+    changed, every refresh_interval seconds, or once the box has drifted from
+    where it was last encoded to an IoU below drift_threshold. The drift check
+    catches a face that moves a little each frame, which association alone
+    would follow indefinitely, e.g. one student stepping into another's place.
+    """
+
+    def __init__(self, iou_threshold=0.5, refresh_interval=10.0, max_age=3.0, drift_threshold=0.7):
+        self.iou_threshold = iou_threshold
+        self.drift_threshold = drift_threshold
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.tracks = []
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def associate(self, face_locations, now):
+        """Return the track for each location, creating tracks for new faces."""
+        self.tracks = [track for track in self.tracks if now - track.last_seen <= self.max_age]
+        assigned = [None] * len(face_locations)
+        if self.tracks and face_locations:
+            iou = box_iou(face_locations, [track.location for track in self.tracks])
+            # Greedy matching, best overlap first
+            used = set()
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                i, j = divmod(int(flat), iou.shape[1])
+                if iou[i, j] < self.iou_threshold:
+                    break
+                if assigned[i] is None and j not in used:
+                    assigned[i] = self.tracks[j]
+                    used.add(j)
+        for i, location in enumerate(face_locations):
+            if assigned[i] is None:
+                assigned[i] = Track(next(self._ids), location, now)
+                self.tracks.append(assigned[i])
+            assigned[i].location = location
+            assigned[i].last_seen = now
+        return assigned
+
+    def needs_encoding(self, track, now, gallery_version):
+        return (track.encoded_at is None
+                or track.gallery_version != gallery_version
+                or now - track.encoded_at >= self.refresh_interval
+                or box_iou(track.location, track.encoded_location)[0, 0] < self.drift_threshold)
+
+    def identify(self, track, encoding, roll, distance, now, gallery_version):
+        track.encoding = encoding
+        track.roll = roll
+        track.distance = distance
+        track.encoded_at = now
+        track.encoded_location = track.location
+        track.gallery_version = gallery_version